@@ -1,16 +1,22 @@
+import asyncio
 import hjson
 import os
 import random
 import shlex
+import tempfile
+import threading
 import time
+from typing import List, Optional
 from requests import get
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from cogs.resource import CogConfig, CogText
 from core import acl, rubbercog, utils
 from core.config import config
+from core.matcher import AhoCorasick, Trie
+from core.paginator import paginator
 
 
 class Actress(rubbercog.Rubbercog):
@@ -28,7 +34,27 @@ class Actress(rubbercog.Rubbercog):
             self.reactions = hjson.load(open(self.path + "reactions.hjson"))
         except:
             self.reactions = {}
-        self.usage = {}
+        self.triggers = Triggers(self.reactions)
+        try:
+            self.usage = hjson.load(open(self.path + "usage.hjson"))
+        except:
+            self.usage = {}
+
+        paginator.register("react list", self.scrollReactions)
+
+        # changes waiting for the background writer
+        self.dirty = set()
+        # files are written from worker threads and by cog_unload()
+        self.write_lock = threading.Lock()
+        self.save.change_interval(seconds=self.config.get("save interval"))
+        self.save.start()
+
+    def cog_unload(self):
+        paginator.unregister("react list")
+        self.save.cancel()
+        for filename in list(self.dirty):
+            self._write(filename)
+        self.dirty.clear()
 
     ##
     ## Commands
@@ -131,13 +157,14 @@ class Actress(rubbercog.Rubbercog):
         message = await ctx.send(embed=embed)
 
         if len(self.reactions) > 1:
+            await paginator.add(message, "react list", {"author": ctx.author.id, "page": 0})
             await message.add_reaction("◀")
             await message.add_reaction("▶")
 
     @commands.check(acl.check)
     @react.command(name="usage", aliases=["stat", "stats"])
     async def react_usage(self, ctx):
-        """See reactions usage since start"""
+        """See reactions usage"""
         items = {
             k: v for k, v in sorted(self.usage.items(), key=lambda item: item[1], reverse=True)
         }
@@ -184,6 +211,7 @@ class Actress(rubbercog.Rubbercog):
         reaction = await self.parse_react_message(ctx.message, strict=True)
         self.reactions[name] = reaction
         self._save_reactions()
+        self.triggers = Triggers(self.reactions)
 
         await self.output.info(ctx, self.text.get("reaction_add", name=name))
         await self.event.sudo(ctx, f"Reaction **{name}** added.")
@@ -220,6 +248,7 @@ class Actress(rubbercog.Rubbercog):
 
         self.reactions[name] = reaction
         self._save_reactions()
+        self.triggers = Triggers(self.reactions)
 
         await self.output.info(ctx, self.text.get("reaction_edit", name=name))
         await self.event.sudo(ctx, f"Reaction **{name}** updated.")
@@ -235,6 +264,7 @@ class Actress(rubbercog.Rubbercog):
 
         del self.reactions[name]
         self._save_reactions()
+        self.triggers = Triggers(self.reactions)
 
         await self.output.info(ctx, self.text.get("reaction_remove", name=name))
         await self.event.sudo(ctx, f"Reaction **{name}** removed.")
@@ -328,7 +358,8 @@ class Actress(rubbercog.Rubbercog):
             return
         # fmt: on
 
-        for name, reaction in self.reactions.items():
+        for name in self.triggers.match(message.content):
+            reaction = self.reactions[name]
             # test
             if not self._reaction_matches(message, reaction):
                 continue
@@ -347,6 +378,7 @@ class Actress(rubbercog.Rubbercog):
                 self.usage[name] += 1
             else:
                 self.usage[name] = 1
+            self.dirty.add("usage.hjson")
 
             # counter
             if "counter" in reaction:
@@ -357,64 +389,95 @@ class Actress(rubbercog.Rubbercog):
                     del self.reactions[name]["counter"]
                     self.reactions[name]["enabled"] = False
                     await self.event.user(message, "Reaction disabled: **{name}**.")
-                self._save_reactions()
+                self.dirty.add("reactions.hjson")
 
             break
 
-    @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
-        # do we care?
-        if (
-            user.bot
-            or len(reaction.message.embeds) != 1
-            or reaction.message.embeds[0].title != f"{config.prefix}react list"
-        ):
-            return
+    ##
+    ## Tasks
+    ##
 
-        if hasattr(reaction, "emoji"):
-            if str(reaction.emoji) == "◀":
-                page_delta = -1
-            elif str(reaction.emoji) == "▶":
-                page_delta = 1
-            else:
-                # invalid reaction
-                return await utils.remove_reaction(reaction, user)
+    @tasks.loop(seconds=60.0)
+    async def save(self):
+        """Write changed counters and usage statistics"""
+        await self._writeDirty()
+
+    async def _writeDirty(self):
+        """Write changed files in worker thread"""
+        while self.dirty:
+            filename = self.dirty.pop()
+            try:
+                await self.bot.loop.run_in_executor(None, self._write, filename)
+            except Exception as e:
+                self.dirty.add(filename)
+                await self.console.error("actress", f"Could not save {filename}.", e)
+                return
+
+    async def scrollReactions(
+        self, reaction: discord.Reaction, user: discord.User, state: dict
+    ) -> Optional[dict]:
+        """react list scrolling"""
+        if str(reaction.emoji) == "◀":
+            page_delta = -1
+        elif str(reaction.emoji) == "▶":
+            page_delta = 1
         else:
             # invalid reaction
             return await utils.remove_reaction(reaction, user)
 
-        embed = reaction.message.embeds[0]
-        if embed.footer == discord.Embed.Empty or " | " not in embed.footer.text:
-            return await utils.remove_reaction(reaction, user)
-
         # allow only the author
-        if embed.footer.text.split(" | ")[0] != str(user):
+        if user.id != state["author"] or not len(self.reactions):
             return await utils.remove_reaction(reaction, user)
 
-        # get page
-        footer_text = embed.footer.text
-        pages = footer_text.split(" | ")[-1]
-        page_current = int(pages.split("/")[0]) - 1
-
-        page = (page_current + page_delta) % len(self.reactions)
-        footer_text = footer_text.replace(pages, f"{page+1}/{len(self.reactions)}")
+        page = (state["page"] + page_delta) % len(self.reactions)
 
         # update embed
         bot_reaction_name = list(self.reactions.keys())[page]
         bot_reaction = self.reactions[bot_reaction_name]
 
+        embed = reaction.message.embeds[0]
         embed = self.fill_reaction_embed(embed, bot_reaction_name, bot_reaction)
-        embed.set_footer(text=footer_text, icon_url=embed.footer.icon_url)
+        footer_text = embed.footer.text.split(" | ")[:-1] + [f"{page+1}/{len(self.reactions)}"]
+        embed.set_footer(text=" | ".join(footer_text), icon_url=embed.footer.icon_url)
         await reaction.message.edit(embed=embed)
 
         await utils.remove_reaction(reaction, user)
+        return {"author": state["author"], "page": page}
 
     ##
     ## Helper functions
     ##
     def _save_reactions(self):
-        with open(self.path + "reactions.hjson", "w", encoding="utf-8") as f:
-            hjson.dump(self.reactions, f, ensure_ascii=False, indent="\t")
+        """Have the reactions written now, not on next save interval"""
+        self.dirty.add("reactions.hjson")
+        asyncio.ensure_future(self._writeDirty())
+
+    def _dump(self, filename: str) -> str:
+        data = self.reactions if filename == "reactions.hjson" else self.usage
+        for _ in range(3):
+            try:
+                return hjson.dumps(data, ensure_ascii=False, indent="\t")
+            except RuntimeError:
+                # the data were changed by the event loop while being dumped
+                continue
+        return hjson.dumps(data, ensure_ascii=False, indent="\t")
+
+    def _write(self, filename: str):
+        """Replace the file atomically, so it is never left half-written
+
+        The data are dumped under the lock, so the last write always has
+        the newest content. Every write uses its own temporary file.
+        """
+        with self.write_lock:
+            content = self._dump(filename)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=filename + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(tmp_path, self.path + filename)
+            except Exception:
+                os.remove(tmp_path)
+                raise
 
     async def _remove_reaction(self, reaction, user):
         try:
@@ -423,40 +486,11 @@ class Actress(rubbercog.Rubbercog):
             pass
 
     def _reaction_matches(self, message, reaction) -> bool:
+        """Check the conditions of reaction whose trigger has been found"""
         # check if it is enabled
         if not reaction["enabled"]:
             return False
 
-        # normalise
-        if reaction["sensitive"]:
-            text = message.content
-            triggers = reaction["triggers"]
-        else:
-            text = message.content.lower()
-            triggers = [x.lower() for x in reaction["triggers"]]
-
-        # check the type
-        if reaction["match"] == "full" and text not in triggers:
-            return False
-        if reaction["match"] == "any":
-            for trigger in triggers:
-                if trigger in text:
-                    break
-            else:
-                return False
-        if reaction["match"] == "start":
-            for trigger in triggers:
-                if text.startswith(trigger):
-                    break
-            else:
-                return False
-        if reaction["match"] == "end":
-            for trigger in triggers:
-                if text.endswith(trigger):
-                    break
-            else:
-                return False
-
         # conditions
         if "users" in reaction and message.author.id not in reaction["users"]:
             return False
@@ -588,6 +622,52 @@ class Actress(rubbercog.Rubbercog):
         # fmt: on
 
 
+class Triggers:
+    """Reaction triggers compiled for matching
+
+    Every message is matched against all reactions in one pass over its content.
+    """
+
+    def __init__(self, reactions: dict):
+        # reaction name -> position, the first matching reaction is used
+        self.order = {name: i for i, name in enumerate(reactions.keys())}
+
+        # case sensitivity -> trigger structures
+        self.full = {True: {}, False: {}}
+        self.any = {True: AhoCorasick(), False: AhoCorasick()}
+        self.start = {True: Trie(), False: Trie()}
+        # triggers are stored reversed, so their suffixes can be looked up as prefixes
+        self.end = {True: Trie(), False: Trie()}
+
+        for name, reaction in reactions.items():
+            sensitive = bool(reaction["sensitive"])
+            for trigger in reaction["triggers"]:
+                if not sensitive:
+                    trigger = trigger.lower()
+
+                if reaction["match"] == "full":
+                    self.full[sensitive].setdefault(trigger, set()).add(name)
+                elif reaction["match"] == "any":
+                    self.any[sensitive].add(trigger, name)
+                elif reaction["match"] == "start":
+                    self.start[sensitive].add(trigger, name)
+                elif reaction["match"] == "end":
+                    self.end[sensitive].add(trigger[::-1], name)
+
+        for automaton in self.any.values():
+            automaton.build()
+
+    def match(self, text: str) -> List[str]:
+        """Return names of reactions triggered by the text, in reaction order"""
+        names = set()
+        for sensitive, content in ((True, text), (False, text.lower())):
+            names.update(self.full[sensitive].get(content, ()))
+            names.update(self.any[sensitive].search(content))
+            names.update(self.start[sensitive].prefixes(content))
+            names.update(self.end[sensitive].prefixes(content[::-1]))
+        return sorted(names, key=self.order.get)
+
+
 class ActressException(rubbercog.RubbercogException):
     pass
 
@@ -1,10 +1,20 @@
 import subprocess
+from typing import Optional
 
 from discord.ext import commands
 
 from cogs.resource import CogConfig, CogText
 from core import acl, rubbercog, utils
 from core.config import config
+from core.paginator import paginator
+from repository.acl_repo import ACLRepository
+from repository.database import TimedQueuePool, database, explain
+from repository.image_repo import ImageRepository
+from repository.karma_repo import KarmaRepository
+from repository.points_repo import PointsRepository
+from repository.review_repo import ReviewRepository
+from repository.seeking_repo import SeekingRepository
+from repository.user_repo import UserRepository
 
 
 class Admin(rubbercog.Rubbercog):
@@ -18,6 +28,11 @@ class Admin(rubbercog.Rubbercog):
 
         self.usage = {}
 
+        paginator.register("commands", self.scrollCommandsStats)
+
+    def cog_unload(self):
+        paginator.unregister("commands")
+
     ##
     ## Commands
     ##
@@ -189,6 +204,84 @@ class Admin(rubbercog.Rubbercog):
         await ctx.send(embed=embed)
         await utils.delete(ctx)
 
+    @commands.check(acl.check)
+    @commands.group(name="sql")
+    async def sql(self, ctx):
+        """Database diagnostics"""
+        if ctx.invoked_subcommand is None:
+            await ctx.send_help(ctx.invoked_with)
+
+    @commands.check(acl.check)
+    @sql.command(name="explain")
+    async def sql_explain(self, ctx):
+        """Find hot queries that have to read whole tables"""
+        dialect = database.db.dialect.name
+        if dialect not in ("postgresql", "sqlite"):
+            return await ctx.send(self.text.get("database", "unsupported", dialect=dialect))
+
+        # fmt: off
+        repositories = (
+            ACLRepository(), ImageRepository(), KarmaRepository(), PointsRepository(),
+            ReviewRepository(), SeekingRepository(), UserRepository(),
+        )
+        # fmt: on
+
+        total = 0
+        scans = []
+        for repository in repositories:
+            for name, query in repository.hot_queries().items():
+                total += 1
+                tables = [t for t in map(self._getScannedTable, explain(query)) if t]
+                if len(tables):
+                    query_name = f"{type(repository).__name__}.{name}"
+                    scans.append(f"{query_name} … {', '.join(tables)}")
+
+        result = self.text.get("database", "explain", scans=len(scans), total=total)
+        if len(scans):
+            result += "\n```\n" + "\n".join(scans) + "\n```"
+        await ctx.send(result)
+
+    @commands.check(acl.check)
+    @sql.command(name="pool")
+    async def sql_pool(self, ctx):
+        """Show connection pool usage"""
+        pool = database.db.pool
+        if not isinstance(pool, TimedQueuePool):
+            return await ctx.send(self.text.get("database", "no_pool", pool=type(pool).__name__))
+
+        stats = pool.stats
+        embed = self.embed(ctx=ctx, title=self.text.get("database", "pool"))
+        # fmt: off
+        embed.add_field(
+            name=self.text.get("database", "in_use"),
+            value=f"{pool.checkedout()} / {pool.capacity()}",
+        )
+        embed.add_field(
+            name=self.text.get("database", "idle"),
+            value=str(pool.checkedin()),
+        )
+        embed.add_field(
+            name=self.text.get("database", "overflow"),
+            value=str(max(pool.overflow(), 0)),
+        )
+        embed.add_field(
+            name=self.text.get("database", "checkouts"),
+            value=self.text.get(
+                "database", "checkouts_value", count=stats.checkouts, timeouts=stats.timeouts
+            ),
+        )
+        embed.add_field(
+            name=self.text.get("database", "wait"),
+            value="{:.1f} / {:.1f} / {:.1f} ms".format(
+                stats.wait_total / max(stats.checkouts, 1) * 1000,
+                stats.percentile(95) * 1000,
+                stats.wait_max * 1000,
+            ),
+            inline=False,
+        )
+        # fmt: on
+        await ctx.send(embed=embed)
+
     @commands.cooldown(rate=2, per=20, type=commands.BucketType.channel)
     @commands.check(acl.check)
     @commands.command(name="commands")
@@ -210,6 +303,7 @@ class Admin(rubbercog.Rubbercog):
         )
 
         message = await ctx.send(embed=embed)
+        await paginator.add(message, "commands", {"offset": 0})
         await message.add_reaction("⏪")
         await message.add_reaction("◀")
         await message.add_reaction("▶")
@@ -231,30 +325,13 @@ class Admin(rubbercog.Rubbercog):
         else:
             self.usage[name] = 1
 
-    @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
+    async def scrollCommandsStats(self, reaction, user, state: dict) -> Optional[dict]:
         """command_stats scrolling"""
         if str(reaction) not in ("⏪", "◀", "▶"):
-            return
-
-        if user.bot:
-            return
-
-        # fmt: off
-        if len(reaction.message.embeds) != 1 \
-        or reaction.message.embeds[0].title != self.text.get("stats", "title"):
-            return
-        # fmt: on
-
-        embed = reaction.message.embeds[0]
-
-        # get current offset
-        if "," in embed.fields[0].name:
-            offset = int(embed.fields[0].name.split(" ")[-1]) - 1
-        else:
-            offset = 0
+            return None
 
         limit = self.config.get("limit")
+        offset = state["offset"]
 
         # get new offset
         if str(reaction) == "⏪":
@@ -268,6 +345,7 @@ class Admin(rubbercog.Rubbercog):
             offset = 0
 
         # apply
+        embed = reaction.message.embeds[0]
         embed.clear_fields()
 
         if offset == 0:
@@ -283,6 +361,7 @@ class Admin(rubbercog.Rubbercog):
 
         await reaction.message.edit(embed=embed)
         await utils.remove_reaction(reaction, user)
+        return {"offset": offset}
 
     ##
     ## Helper functions
@@ -302,6 +381,18 @@ class Admin(rubbercog.Rubbercog):
             data += line
         return data
 
+    def _getScannedTable(self, line: str) -> Optional[str]:
+        """Return table name if the line of query plan is a sequential scan"""
+        line = line.strip()
+        # PostgreSQL: "Seq Scan on users  (cost=...)"
+        if "Seq Scan on " in line:
+            return line.split("Seq Scan on ")[1].split()[0]
+        # SQLite: "SCAN TABLE users" or "SCAN users", without "USING INDEX"
+        if line.startswith("SCAN ") and "USING" not in line:
+            words = line.split()
+            return words[2] if words[1] == "TABLE" and len(words) > 2 else words[1]
+        return None
+
     def getCommandsStats(self, offset: int = 0) -> str:
         items = {
             k: v for k, v in sorted(self.usage.items(), key=lambda item: item[1], reverse=True)
@@ -99,7 +99,7 @@ class Animals(rubbercog.Rubbercog):
         if payload.member.bot:
             return
 
-        message = await self.getChannel().fetch_message(payload.message_id)
+        message = await self.getMessage(self.getChannel(), payload.message_id)
         # fmt: off
         if not message or len(message.embeds) != 1 \
         or message.embeds[0].title != self.text.get("title"):
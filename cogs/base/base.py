@@ -49,12 +49,11 @@ class Base(rubbercog.Rubbercog):
         channel = self.bot.get_channel(payload.channel_id)
         if channel is None or not isinstance(channel, discord.TextChannel):
             return
-        try:
-            message = await channel.fetch_message(payload.message_id)
-        except discord.NotFound:
-            return
         if payload.emoji.is_custom_emoji() or payload.emoji.name != "📌":
             return
+        message = await self.getMessage(channel, payload.message_id)
+        if message is None:
+            return
 
         if message.pinned:
             # TODO Remove the reaction
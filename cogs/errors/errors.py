@@ -9,6 +9,7 @@ from discord.ext import commands
 from cogs.resource import CogText
 from core import rubbercog, utils
 from core.config import config
+from repository.database import session
 
 
 class Errors(rubbercog.Rubbercog):
@@ -140,12 +141,14 @@ class Errors(rubbercog.Rubbercog):
 
         # Database
         if isinstance(error, sqlalchemy.exc.SQLAlchemyError):
+            # failed transaction would block all following queries
+            session.rollback()
             error_name = ".".join([type(error).__module__, type(error).__name__])
             await self.output.critical(ctx, error_name)
             await self.console.critical(ctx, "Database error", error)
             await self.event.user(
                 ctx,
-                f"Database reported`{error_name}`. The session may be invalidated <@{config.admin_id}>",
+                f"Database reported`{error_name}`. The session has been rolled back <@{config.admin_id}>",
                 escape_markdown=False,
             )
             return False
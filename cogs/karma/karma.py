@@ -1,19 +1,23 @@
 import asyncio
-from typing import List
+from collections import OrderedDict, namedtuple
+from typing import List, Optional, Tuple
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from emoji import demojize
 
 from cogs.resource import CogConfig, CogText
 from core import acl, rubbercog, utils
 from core.config import config
+from core.paginator import paginator
 from repository import karma_repo, subject_repo
-from repository.database.karma import Karma as DB_Karma
 
 repo_k = karma_repo.KarmaRepository()
 repo_s = subject_repo.SubjectRepository()
 
+# message metadata needed for karma counting
+MessageInfo = namedtuple("MessageInfo", ["author_id", "guild_id", "channel_id", "banned"])
+
 
 class Karma(rubbercog.Rubbercog):
     """Karma"""
@@ -24,6 +28,19 @@ class Karma(rubbercog.Rubbercog):
         self.config = CogConfig("karma")
         self.text = CogText("karma")
 
+        # message ID -> MessageInfo, least recently used first
+        self.messages = OrderedDict()
+
+        paginator.register("karma", self.scrollBoard)
+
+        self.flush.change_interval(seconds=self.config.get("flush interval"))
+        self.flush.start()
+
+    def cog_unload(self):
+        paginator.unregister("karma")
+        self.flush.cancel()
+        repo_k.flush()
+
     ##
     ## Commands
     ##
@@ -87,22 +104,24 @@ class Karma(rubbercog.Rubbercog):
         emotes = [e for e in emotes if not e.animated]
         content = []
 
-        emotes_positive = self._getEmoteList(emotes, "1")
+        emote_lists = self._getEmoteLists(emotes)
+
+        emotes_positive = emote_lists.get(1, [])
         if len(emotes_positive) > 0:
             content.append(self.text.get("emojis_positive"))
             content += self._emoteListToMessage(emotes_positive)
 
-        emotes_neutral = self._getEmoteList(emotes, "0")
+        emotes_neutral = emote_lists.get(0, [])
         if len(emotes_neutral) > 0:
             content.append(self.text.get("emojis_neutral"))
             content += self._emoteListToMessage(emotes_neutral)
 
-        emotes_negative = self._getEmoteList(emotes, "-1")
+        emotes_negative = emote_lists.get(-1, [])
         if len(emotes_negative) > 0:
             content.append(self.text.get("emojis_negative"))
             content += self._emoteListToMessage(emotes_negative)
 
-        emotes_nonvoted = self._getNonvotedEmoteList(emotes)
+        emotes_nonvoted = emote_lists.get(None, [])
         if len(emotes_nonvoted) > 0:
             content.append(self.text.get("emojis_not_voted"))
             content += self._emoteListToMessage(emotes_nonvoted)
@@ -216,16 +235,14 @@ class Karma(rubbercog.Rubbercog):
 
         # fmt: off
         count = True
-        if message.channel.id in self.config.get("banned channels") \
+        if message.channel.id in self.config.get_set("banned channels") \
         or (
             not self.config.get("count subjects")
-            and repo_s.get(message.channel.name) is not None
+            and repo_s.isSubject(message.channel.name)
         ):
             count = False
-        for word in self.config.get("banned words"):
-            if word in message.content:
-                count = False
-                break
+        if self._hasBannedWords(message.content):
+            count = False
         # fmt: on
 
         output = {"negative": [], "neutral": [], "positive": []}
@@ -319,7 +336,8 @@ class Karma(rubbercog.Rubbercog):
         if not count:
             return
 
-        repo_k.karma_emoji(message.author, member, emote)
+        repo_k.karma_emoji(discord.Object(id=message.author_id), member, emote)
+        await self._checkLedger()
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload):
@@ -333,20 +351,52 @@ class Karma(rubbercog.Rubbercog):
         if not count:
             return
 
-        repo_k.karma_emoji_remove(message.author, member, emote)
+        repo_k.karma_emoji_remove(discord.Object(id=message.author_id), member, emote)
+        await self._checkLedger()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Remember message metadata for reactions"""
+        if isinstance(message.channel, discord.TextChannel):
+            self._cacheMessage(message)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        """Update message metadata"""
+        info = self.messages.get(payload.message_id)
+        if info is None:
+            return
+        if "content" in payload.data:
+            self.messages[payload.message_id] = info._replace(
+                banned=self._hasBannedWords(payload.data["content"])
+            )
+
+    @commands.Cog.listener()
+    async def on_config_reload(self, cog: str):
+        """Forget message metadata, banned words may have changed"""
+        if cog == "karma":
+            self.messages.clear()
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """Forget message metadata"""
+        self.messages.pop(payload.message_id, None)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """Forget message metadata"""
+        for message_id in payload.message_ids:
+            self.messages.pop(message_id, None)
 
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction, user):
-        """Scrolling, vote"""
+        """Vote"""
         if user.bot:
             return
 
         if reaction.message.channel.id == config.get("channels", "vote"):
             await self.checkVoteEmote(reaction, user)
 
-        if str(reaction) in ("⏪", "◀", "▶"):
-            await self.checkBoardEmoji(reaction, user)
-
     ##
     ## Helper functions
     ##
@@ -358,22 +408,14 @@ class Karma(rubbercog.Rubbercog):
             return False
         return demojized != text
 
-    def _getEmoteList(self, guild_emotes: list, value: int) -> list:
-        db_emotes = repo_k.getEmotesByValue(value)
-
-        result = []
-        for guild_emote in guild_emotes:
-            if str(guild_emote.id) in db_emotes:
-                result.append(guild_emote)
-        return result
-
-    def _getNonvotedEmoteList(self, guild_emotes: list) -> list:
-        db_emotes = [x.emoji_ID for x in repo_k.get_all_emojis()]
+    def _getEmoteLists(self, guild_emotes: list) -> dict:
+        """Sort guild emotes by their value; None holds emotes without one"""
+        values = repo_k.getEmojiValues()
 
-        result = []
+        result = {}
         for guild_emote in guild_emotes:
-            if str(guild_emote.id) not in db_emotes:
-                result.append(guild_emote)
+            value = values.get(str(guild_emote.id))
+            result.setdefault(value, []).append(guild_emote)
         return result
 
     def _emoteListToMessage(self, emotes: list) -> List[str]:
@@ -394,7 +436,7 @@ class Karma(rubbercog.Rubbercog):
         return emote
 
     async def _payloadToReaction(self, payload: discord.RawReactionActionEvent) -> tuple:
-        """Return (channel, member, message, emote)"""
+        """Return (channel, member, message info, emote)"""
         channel = self.bot.get_channel(payload.channel_id)
         if channel is None or not isinstance(channel, discord.TextChannel):
             return
@@ -403,10 +445,11 @@ class Karma(rubbercog.Rubbercog):
         if member is None or member.bot:
             return
 
-        try:
-            message = await channel.fetch_message(payload.message_id)
-        except discord.NotFound:
+        # do not fetch messages whose reactions would not be counted anyway
+        if not self.isCountable(member=member, channel=channel):
             return
+
+        message = await self._getMessageInfo(channel, payload.message_id)
         if message is None:
             return
 
@@ -417,42 +460,96 @@ class Karma(rubbercog.Rubbercog):
 
         return channel, member, message, emote
 
+    async def _getMessageInfo(
+        self, channel: discord.TextChannel, message_id: int
+    ) -> Optional[MessageInfo]:
+        """Get message metadata
+
+        Look into own cache first, then get the message through the shared resolver.
+        """
+        info = self.messages.get(message_id)
+        if info is not None:
+            self.messages.move_to_end(message_id)
+            return info
+
+        message = await self.getMessage(channel, message_id)
+        if message is None:
+            return None
+
+        return self._cacheMessage(message)
+
+    def _cacheMessage(self, message: discord.Message) -> MessageInfo:
+        info = MessageInfo(
+            author_id=message.author.id,
+            guild_id=message.guild.id,
+            channel_id=message.channel.id,
+            banned=self._hasBannedWords(message.content),
+        )
+        self.messages[message.id] = info
+        self.messages.move_to_end(message.id)
+        while len(self.messages) > self.config.get("message cache"):
+            self.messages.popitem(last=False)
+        return info
+
+    def _hasBannedWords(self, content: str) -> bool:
+        return self.config.get_regex("banned words").search(content) is not None
+
     async def _remove_reaction(self, reaction, user):
         try:
             await reaction.remove(user)
         except:
             pass
 
+    async def _checkLedger(self):
+        """Flush karma changes if there are too many of them"""
+        if repo_k.pending() >= self.config.get("flush events"):
+            await self._flushLedger()
+
+    async def _flushLedger(self):
+        try:
+            await repo_k.run(repo_k.flush)
+        except Exception as e:
+            await self.console.error("karma", "Could not write karma changes.", e)
+
     ##
     ## Logic
     ##
-    def doCountKarma(self, *, member: discord.Member, message: discord.Message) -> bool:
-        """Return True only if the message should be counted"""
-        # do not count author's reactions
-        if member.id == message.author.id:
+    def isCountable(self, *, member: discord.Member, channel: discord.TextChannel) -> bool:
+        """Return True if reactions of the member in the channel may be counted
+
+        Only uses data in memory, so it is checked before the message is fetched.
+        """
+        # do not count banned channels
+        if channel.id in self.config.get_set("banned channels"):
             return False
 
         # only count master and slave guilds
-        if message.guild.id not in (config.guild_id, config.slave_id):
+        if channel.guild.id not in (config.guild_id, config.slave_id):
             return False
 
-        # do not count banned channels
-        if message.channel.id in self.config.get("banned channels"):
+        # do not count banned roles
+        banned_roles = self.config.get_set("banned roles")
+        if len(banned_roles) and not banned_roles.isdisjoint(role.id for role in member.roles):
             return False
 
-        # do not count banned roles
-        if self.config.get("banned roles") in map(lambda x: x.id, member.roles):
+        # optionally, do not count subject channels
+        if not self.config.get("count subjects") and repo_s.isSubject(channel.name):
             return False
 
-        # do not count banned strings
-        for word in self.config.get("banned words"):
-            if word in message.content:
-                return False
+        return True
 
-        # optionally, do not count subject channels
-        if not self.config.get("count subjects"):
-            if repo_s.get(message.channel.name) is not None:
-                return False
+    def doCountKarma(self, *, member: discord.Member, message: MessageInfo) -> bool:
+        """Return True only if the message should be counted
+
+        isCountable() has to be checked first.
+        """
+        # do not count author's reactions
+        if member.id == message.author_id:
+            return False
+
+        # do not count banned strings
+        if message.banned:
+            return False
 
         return True
 
@@ -478,16 +575,35 @@ class Karma(rubbercog.Rubbercog):
         # fmt: on
         description = self.text.get("board_" + parameter + "_d")
         embed = self.embed(ctx=ctx, title=title, description=description)
-        embed = self.fillBoard(embed, member=ctx.author, order=parameter, offset=offset)
+        embed, state = self.fillBoard(embed, member=ctx.author, order=parameter, offset=offset)
 
         message = await ctx.send(embed=embed)
+        if state is not None:
+            await paginator.add(message, "karma", state)
         await message.add_reaction("⏪")
         await message.add_reaction("◀")
         await message.add_reaction("▶")
 
         await utils.room_check(ctx)
 
-    def fillBoard(self, embed, *, member, order: str, offset: int) -> discord.Embed:
+    def fillBoard(
+        self,
+        embed,
+        *,
+        member,
+        order: str,
+        offset: int = 0,
+        cursor: tuple = None,
+        forward: bool = True,
+    ) -> Tuple[Optional[discord.Embed], Optional[dict]]:
+        """Fill leaderboard page
+
+        The page is selected by the cursor, see Ranking.seek(), or by offset if there
+        is no cursor. Returns None instead of embed if the page is empty.
+
+        Returns the embed and paginator state: ordering and (value, member ID) keys
+        of the first and last displayed row.
+        """
         limit = self.config.get("leaderboard limit")
         template = "`{position:>2}` … `{karma:>5}` {username}"
 
@@ -498,21 +614,17 @@ class Karma(rubbercog.Rubbercog):
         elif order == "take":
             column = "negative"
 
-        if order == "desc":
-            attr = DB_Karma.karma.desc()
-        elif order == "asc":
-            attr = DB_Karma.karma
-        elif order == "give":
-            attr = DB_Karma.positive.desc()
-        elif order == "take":
-            attr = DB_Karma.negative.desc()
-
         # construct first field
         value = []
-        board = repo_k.getLeaderboard(attr, offset, limit)
+        if cursor is None:
+            board = repo_k.getLeaderboard(column, offset, limit, descending=order != "asc")
+        else:
+            offset, board = repo_k.seekLeaderboard(
+                column, cursor, limit, descending=order != "asc", forward=forward
+            )
 
-        if not board or not board.count():
-            return None
+        if not len(board):
+            return None, None
 
         user_in_list = False
         for i, db_user in enumerate(board, start=offset):
@@ -560,7 +672,12 @@ class Karma(rubbercog.Rubbercog):
                 value=template.format(position=position, karma=value, username=username),
             )
 
-        return embed
+        first, last = board[0], board[-1]
+        return embed, {
+            "order": order,
+            "first": (getattr(first, column), first.discord_id),
+            "last": (getattr(last, column), last.discord_id),
+        }
 
     async def checkVoteEmote(self, reaction, user):
         """Check if the emote is vote emote"""
@@ -573,48 +690,29 @@ class Karma(rubbercog.Rubbercog):
         if str(reaction.emoji) not in ("☑️", "0⃣", "❎"):
             await self._remove_reaction(reaction, user)
 
-    async def checkBoardEmoji(self, reaction, user):
-        """Check if the leaderboard should be scrolled"""
-        if user.bot:
-            return
-
+    async def scrollBoard(self, reaction, user, state: dict) -> Optional[dict]:
+        """Scroll the leaderboard, see fillBoard() for its state"""
         if str(reaction) not in ("⏪", "◀", "▶"):
-            return
-
-        # fmt: off
-        if len(reaction.message.embeds) != 1 \
-        or type(reaction.message.embeds[0].title) != str \
-        or not reaction.message.embeds[0].title.startswith(self.text.get("board_title")):
-            return
-        # fmt: on
-
-        embed = reaction.message.embeds[0]
-
-        # get ordering
-        for o in ("desc", "asc", "give", "take"):
-            if embed.title.endswith(self.text.get("board_" + o + "_t")):
-                order = o
-                break
-
-        # get current offset
-        if "," in embed.fields[0].name:
-            offset = int(embed.fields[0].name.split(" ")[-1]) - 1
-        else:
-            offset = 0
+            return None
 
-        # get new offset
         if str(reaction) == "⏪":
-            offset = 0
+            page = {"order": state["order"]}
         elif str(reaction) == "◀":
-            offset -= self.config.get("leaderboard limit")
-        elif str(reaction) == "▶":
-            offset += self.config.get("leaderboard limit")
-
-        if offset < 0:
-            offset = 0
+            page = {"order": state["order"], "cursor": state["first"], "forward": False}
+        else:
+            page = {"order": state["order"], "cursor": state["last"]}
 
-        # apply
-        embed = self.fillBoard(embed, member=user, order=order, offset=offset)
+        embed, new_state = self.fillBoard(reaction.message.embeds[0], member=user, **page)
         if embed:
             await reaction.message.edit(embed=embed)
         await utils.remove_reaction(reaction, user)
+        return new_state
+
+    ##
+    ## Tasks
+    ##
+
+    @tasks.loop(seconds=5.0)
+    async def flush(self):
+        """Write buffered karma changes to database"""
+        await self._flushLedger()
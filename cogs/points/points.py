@@ -1,12 +1,14 @@
-import datetime
+import heapq
 import random
-from typing import Union
+import time
+from typing import List, Optional, Union
 
 import discord
 from discord.ext import commands, tasks
 
 from cogs.resource import CogConfig, CogText
 from core import rubbercog, utils
+from core.paginator import paginator
 from repository.points_repo import PointsRepository
 
 repo_p = PointsRepository()
@@ -26,10 +28,20 @@ class Points(rubbercog.Rubbercog):
         self.limits_reaction = self.config.get("points_reaction")
         self.timer_reaction = self.config.get("timer_reaction")
 
-        self.stats_message = {}
-        self.stats_reaction = {}
+        self.cooldown_message = Cooldown(self.timer_message)
+        self.cooldown_reaction = Cooldown(self.timer_reaction)
+
+        paginator.register("points", self.scrollBoard)
 
         self.cleanup.start()
+        self.flush.change_interval(seconds=self.config.get("flush_interval"))
+        self.flush.start()
+
+    def cog_unload(self):
+        paginator.unregister("points")
+        self.cleanup.cancel()
+        self.flush.cancel()
+        repo_p.flush()
 
     ##
     ## Commands
@@ -70,7 +82,8 @@ class Points(rubbercog.Rubbercog):
             title=self.text.get("embed", "title") + self.text.get("embed", "desc_suffix"),
             description=self.text.get("embed", "desc_description"),
         )
-        users = repo_p.getUsers("desc", limit=self.config.get("board"), offset=0)
+        order = "desc"
+        users = repo_p.getUsers(order, limit=self.config.get("board"), offset=0)
         value = self._getBoard(ctx.author, users)
         embed.add_field(
             name=self.text.get("embed", "desc_0", num=self.config.get("board")),
@@ -91,6 +104,7 @@ class Points(rubbercog.Rubbercog):
             )
 
         message = await ctx.send(embed=embed)
+        await paginator.add(message, "points", self._getState(order, users))
         await message.add_reaction("⏪")
         await message.add_reaction("◀")
         await message.add_reaction("▶")
@@ -104,7 +118,8 @@ class Points(rubbercog.Rubbercog):
             title=self.text.get("embed", "title") + self.text.get("embed", "asc_suffix"),
             description=self.text.get("embed", "asc_description"),
         )
-        users = repo_p.getUsers("asc", limit=self.config.get("board"), offset=0)
+        order = "asc"
+        users = repo_p.getUsers(order, limit=self.config.get("board"), offset=0)
         value = self._getBoard(ctx.author, users)
         embed.add_field(
             name=self.text.get("embed", "asc_0", num=self.config.get("board")), value=value
@@ -123,6 +138,7 @@ class Points(rubbercog.Rubbercog):
             )
 
         message = await ctx.send(embed=embed)
+        await paginator.add(message, "points", self._getState(order, users))
         await message.add_reaction("⏪")
         await message.add_reaction("◀")
         await message.add_reaction("▶")
@@ -138,82 +154,49 @@ class Points(rubbercog.Rubbercog):
         if message.author.bot:
             return
 
-        now = datetime.datetime.now()
-
-        if (
-            str(message.author.id) in self.stats_message
-            and (now - self.stats_message[str(message.author.id)]).total_seconds()
-            < self.timer_message
-        ):
+        if not self.cooldown_message.hit(message.author.id):
             return
 
         value = random.randint(self.limits_message[0], self.limits_message[1])
-        self.stats_message[str(message.author.id)] = now
         repo_p.increment(message.author.id, value)
+        await self._checkLedger()
 
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction, user):
-        """Handle board scrolling"""
+        """Add points on reaction"""
         if user.bot:
             return
 
-        # add points
-        now = datetime.datetime.now()
-        if (
-            str(user.id) not in self.stats_reaction
-            or (now - self.stats_reaction[str(user.id)]).total_seconds() >= self.timer_reaction
-        ):
+        if self.cooldown_reaction.hit(user.id):
             value = random.randint(self.limits_reaction[0], self.limits_reaction[1])
-            self.stats_reaction[str(user.id)] = now
             repo_p.increment(user.id, value)
+            await self._checkLedger()
 
+    async def scrollBoard(self, reaction, user, state: dict) -> Optional[dict]:
+        """Scroll the leaderboard, see _getState() for its state"""
         if str(reaction) not in ("⏪", "◀", "▶"):
-            return
-
-        # fmt: off
-        if len(reaction.message.embeds) != 1 \
-        or type(reaction.message.embeds[0].title) != str \
-        or not reaction.message.embeds[0].title.startswith(self.text.get("embed", "title")):
-            return
-        # fmt: on
-
-        embed = reaction.message.embeds[0]
-
-        # get ordering
-        if embed.title.endswith(self.text.get("embed", "desc_suffix")):
-            order = "desc"
-        else:
-            order = "asc"
-
-        # get current offset
-        if ", " in embed.fields[0].name:
-            offset = int(embed.fields[0].name.split(" ")[-1]) - 1
-        else:
-            offset = 0
+            return None
 
-        # get new offset
+        order = state["order"]
+        limit = self.config.get("board")
         if str(reaction) == "⏪":
-            offset = 0
+            offset, users = 0, repo_p.getUsers(order, limit=limit, offset=0)
         elif str(reaction) == "◀":
-            offset -= self.config.get("board")
-        elif str(reaction) == "▶":
-            offset += self.config.get("board")
-
-        if offset < 0:
-            return await utils.remove_reaction(reaction, user)
+            offset, users = repo_p.seekUsers(order, state["first"], limit, forward=False)
+        else:
+            offset, users = repo_p.seekUsers(order, state["last"], limit)
 
-        users = repo_p.getUsers(order, limit=self.config.get("board"), offset=offset)
         value = self._getBoard(user, users)
         if not value:
-            # offset too big
-            return await utils.remove_reaction(reaction, user)
+            # there are no more users
+            await utils.remove_reaction(reaction, user)
+            return None
 
+        embed = reaction.message.embeds[0]
         if offset:
-            name = self.text.get(
-                "embed", order + "_n", num=self.config.get("board"), offset=offset + 1
-            )
+            name = self.text.get("embed", order + "_n", num=limit, offset=offset + 1)
         else:
-            name = self.text.get("embed", order + "_0", num=self.config.get("board"))
+            name = self.text.get("embed", order + "_0", num=limit)
         embed.clear_fields()
         embed.add_field(name=name, value=value, inline=False)
 
@@ -231,6 +214,7 @@ class Points(rubbercog.Rubbercog):
 
         await reaction.message.edit(embed=embed)
         await utils.remove_reaction(reaction, user)
+        return self._getState(order, users)
 
     ##
     ## Helper functions
@@ -254,21 +238,83 @@ class Points(rubbercog.Rubbercog):
             result.append(template.format(points=db_user.points, name=name))
         return "\n".join(result)
 
+    def _getState(self, order: str, users: List) -> dict:
+        """Get paginator state: ordering and (points, user ID) keys of first and last row"""
+        if not len(users):
+            return {"order": order, "first": None, "last": None}
+        return {
+            "order": order,
+            "first": (users[0].points, users[0].user_id),
+            "last": (users[-1].points, users[-1].user_id),
+        }
+
+    async def _checkLedger(self):
+        """Flush point increments if there are too many of them"""
+        if repo_p.pending() >= self.config.get("flush_events"):
+            await self._flushLedger()
+
+    async def _flushLedger(self):
+        try:
+            await repo_p.run(repo_p.flush)
+        except Exception as e:
+            await self.console.error("points", "Could not write points.", e)
+
     ##
     ## Tasks
     ##
 
+    @tasks.loop(seconds=5.0)
+    async def flush(self):
+        """Write buffered points to database"""
+        await self._flushLedger()
+
     @tasks.loop(seconds=120.0)
     async def cleanup(self):
-        delete = []
-        for uid, time in self.stats_message.items():
-            if (datetime.datetime.now() - time).total_seconds() >= self.timer_message:
-                delete.append(uid)
-        for uid in delete:
-            self.stats_message.pop(uid)
-        delete = []
-        for uid, time in self.stats_reaction.items():
-            if (datetime.datetime.now() - time).total_seconds() >= self.timer_reaction:
-                delete.append(uid)
-        for uid in delete:
-            self.stats_reaction.pop(uid)
+        self.cooldown_message.expire()
+        self.cooldown_reaction.expire()
+
+
+class Cooldown:
+    """Per-user cooldown measured on monotonic clock
+
+    End times are kept in a heap as well, so expired users are removed without
+    going through all of them.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        # user ID -> time the cooldown ends
+        self.until = {}
+        # (time the cooldown ends, user ID)
+        self.heap = []
+
+    def __len__(self):
+        return len(self.until)
+
+    def hit(self, user_id: int) -> bool:
+        """Start the cooldown, if the user is not in one
+
+        Returns True if the cooldown has been started.
+        """
+        now = time.monotonic()
+        if self.until.get(user_id, 0) > now:
+            return False
+
+        end = now + self.seconds
+        self.until[user_id] = end
+        heapq.heappush(self.heap, (end, user_id))
+        return True
+
+    def expire(self) -> int:
+        """Forget users whose cooldown has ended
+
+        Returns number of removed users.
+        """
+        now = time.monotonic()
+        removed = 0
+        while len(self.heap) and self.heap[0][0] <= now:
+            end, user_id = heapq.heappop(self.heap)
+            if self.until.get(user_id) == end:
+                del self.until[user_id]
+                removed += 1
+        return removed
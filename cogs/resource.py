@@ -1,45 +1,127 @@
+import os
 import re
+import weakref
 from collections import OrderedDict
+from typing import Dict, List, Tuple
 
 import hjson
 
 from core.emote import emote
+from core.text import Template
 
 
 class CogConfig:
-    """Configuration manager"""
+    """Configuration manager
+
+    Values are flattened into a table keyed by their path when the files are
+    loaded. Changed files are loaded again by reload_all().
+    """
+
+    # all managers, so they can be reloaded
+    instances = weakref.WeakSet()
 
     def __init__(self, cog_name: str):
+        self.cog_name = cog_name
+        self.load()
+        CogConfig.instances.add(self)
+
+    def load(self):
+        mtimes = self._mtimes()
+
         # load default configuration
-        self.config = hjson.load(open(f"cogs/{cog_name}/config.default.hjson"))
+        config = hjson.load(open(f"cogs/{self.cog_name}/config.default.hjson"))
 
         # load custom configuration
         try:
-            custom = hjson.load(open(f"cogs/{cog_name}/config.hjson"))
+            custom = hjson.load(open(f"cogs/{self.cog_name}/config.hjson"))
 
-            for key, value in self.config.items():
+            for key, value in config.items():
                 # allow two layers
                 if not key.startswith("_") and (
                     isinstance(value, OrderedDict) or isinstance(value, dict)
                 ):
                     for subkey in value.keys():
                         if key in custom.keys() and subkey in custom[key].keys():
-                            self.config[key][subkey] = custom[key][subkey]
+                            config[key][subkey] = custom[key][subkey]
                 elif key in custom.keys():
-                    self.config[key] = custom[key]
+                    config[key] = custom[key]
         except:
             # there is no custom config
             pass
 
+        # key path -> value
+        values = {}
+        self._flatten(values, config, ())
+
+        self.config = config
+        self.values = values
+        # key path -> frozenset or compiled regex, filled on first use
+        self.lookups = {}
+        self.mtimes = mtimes
+
+    @classmethod
+    def reload_all(cls) -> Tuple[List[str], Dict[str, Exception]]:
+        """Load changed configuration files again
+
+        Returns names of reloaded cogs and errors of cogs that could not be reloaded.
+        """
+        reloaded = []
+        failed = {}
+        for instance in list(cls.instances):
+            mtimes = instance._mtimes()
+            if mtimes == instance.mtimes:
+                continue
+            try:
+                instance.load()
+            except Exception as e:
+                # keep the previous values until the file is changed again
+                instance.mtimes = mtimes
+                failed[instance.cog_name] = e
+                continue
+            reloaded.append(instance.cog_name)
+        return reloaded, failed
+
     def get(self, *args):
-        result = self.config
-        for arg in args:
-            if arg in result:
-                result = result[arg]
-            else:
-                raise ValueError(f"Could not get config value at `{'/'.join(args)}`.")
+        try:
+            return self.values[args]
+        except KeyError:
+            raise ValueError(f"Could not get config value at `{'/'.join(args)}`.")
+
+    def get_set(self, *args) -> frozenset:
+        """Get list value as a set, for fast membership tests"""
+        key = ("set",) + args
+        result = self.lookups.get(key)
+        if result is None:
+            result = frozenset(self.get(*args))
+            self.lookups[key] = result
+        return result
+
+    def get_regex(self, *args) -> re.Pattern:
+        """Get list of strings as a regex matching any of them"""
+        key = ("regex",) + args
+        result = self.lookups.get(key)
+        if result is None:
+            words = [re.escape(word) for word in self.get(*args)]
+            # pattern that never matches if the list is empty
+            result = re.compile("|".join(words) if len(words) else r"(?!)")
+            self.lookups[key] = result
         return result
 
+    def _flatten(self, values: dict, node: dict, path: tuple):
+        for key, value in node.items():
+            values[path + (key,)] = value
+            if isinstance(value, dict):
+                self._flatten(values, value, path + (key,))
+
+    def _mtimes(self) -> tuple:
+        result = []
+        for filename in ("config.default.hjson", "config.hjson"):
+            try:
+                result.append(os.stat(f"cogs/{self.cog_name}/{filename}").st_mtime)
+            except FileNotFoundError:
+                result.append(None)
+        return tuple(result)
+
 
 class CogText:
     """Text manager"""
@@ -64,35 +146,46 @@ class CogText:
             # there is no custom config
             pass
 
+        # key path -> Template or list of Templates, emojis are already applied
+        self.templates = {}
+        self._compile(self.config, ())
+
     def get(self, *args, **kwargs):
-        # get string
-        result = self.config
-        for arg in args:
-            if arg in result:
-                result = result[arg]
-            else:
-                raise ValueError(f"Could not get text at `{'/'.join(args)}`.")
-
-        def replace(result: str):
-            # apply emojis
-            emojis = re.findall(r"\(\(emoji\.([a-z]+)\)\)", result)
-            for emoji in emojis:
-                result = result.replace(f"((emoji.{emoji}))", emote.get(emoji))
-
-            # apply kwargs
-            for key, value in kwargs.items():
-                replacement = "((" + key + "))"
-                if replacement in result:
-                    result = result.replace(replacement, str(value))
+        template = self.templates.get(args)
+        if template is None:
+            # not a string, return the value as it is
+            result = self.config
+            for arg in args:
+                if arg in result:
+                    result = result[arg]
                 else:
+                    raise ValueError(f"Could not get text at `{'/'.join(args)}`.")
+            return result
+
+        def render(template: Template):
+            for key in kwargs.keys():
+                if key not in template.keys:
                     raise ValueError(
                         f"Requested string `{'/'.join(args)}` does not have key `{key}`."
                     )
-            return result
-
-        if type(result) == str:
-            result = replace(result)
-        elif type(result) == list:
-            result = [replace(x) for x in result]
-
-        return result
+            return template.render(kwargs)
+
+        if type(template) == list:
+            return [render(x) for x in template]
+        return render(template)
+
+    def _compile(self, node: dict, path: tuple):
+        for key, value in node.items():
+            if isinstance(value, dict):
+                self._compile(value, path + (key,))
+            elif type(value) == str:
+                self.templates[path + (key,)] = self._template(value)
+            elif type(value) == list:
+                self.templates[path + (key,)] = [self._template(x) for x in value]
+
+    def _template(self, text: str) -> Template:
+        # apply emojis
+        text = re.sub(
+            r"\(\(emoji\.([a-z]+)\)\)", lambda m: emote.get(m.group(1)) or m.group(0), text
+        )
+        return Template(text, "((", "))")
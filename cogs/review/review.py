@@ -1,8 +1,11 @@
+from typing import Optional
+
 import discord
 from discord.ext import commands
 
 from cogs.resource import CogText
 from core import acl, rubbercog, utils
+from core.paginator import paginator
 from repository import review_repo, subject_repo
 
 repo_r = review_repo.ReviewRepository()
@@ -17,6 +20,11 @@ class Review(rubbercog.Rubbercog):
 
         self.text = CogText("review")
 
+        paginator.register("review", self.scrollReviews)
+
+    def cog_unload(self):
+        paginator.unregister("review")
+
     ##
     ## Commands
     ##
@@ -55,6 +63,7 @@ class Review(rubbercog.Rubbercog):
         embed = self.fill_subject_embed(embed, review, average)
 
         message = await ctx.send(embed=embed)
+        await paginator.add(message, "review", {"subject": subject, "page": 0})
         if db_reviews.count() > 1:
             await message.add_reaction("◀")
             await message.add_reaction("▶")
@@ -165,7 +174,7 @@ class Review(rubbercog.Rubbercog):
         if db_subject is None:
             return await ctx.send(self.text.get("no_subject"))
 
-        repo_s.update(subject, name, category)
+        repo_s.update(subject, name=name, category=category)
         await self.event.sudo(ctx, f"Subject **{subject}** updated.")
         await ctx.send(self.text.get("subject_updated"))
 
@@ -188,56 +197,40 @@ class Review(rubbercog.Rubbercog):
     ## Listeners
     ##
 
-    @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
-        # check for wanted embed
-        if (
-            user.bot
-            or len(reaction.message.embeds) != 1
-            or not isinstance(reaction.message.embeds[0].title, str)
-            or not reaction.message.embeds[0].title.startswith(self.text.get("embed", "title"))
-        ):
-            return
-
+    async def scrollReviews(
+        self, reaction: discord.Reaction, user: discord.User, state: dict
+    ) -> Optional[dict]:
+        """Scroll the reviews and vote for them"""
         scroll = False
         vote = False
         scroll_delta = 0
         vote_value = 0
 
-        # check for scroll availability
-        if hasattr(reaction, "emoji"):
-            # scrolling
-            if str(reaction.emoji) == "◀":
-                scroll = True
-                scroll_delta = -1
-            elif str(reaction.emoji) == "▶":
-                scroll = True
-                scroll_delta = 1
-            # voting
-            elif str(reaction.emoji) == "👍":
-                vote = True
-                vote_value = 1
-            elif str(reaction.emoji) == "🛑":
-                vote = True
-                vote_value = 0
-            elif str(reaction.emoji) == "👎":
-                vote = True
-                vote_value = -1
-            # invalid
-            else:
-                # invalid reaction
-                return await self._remove_reaction(reaction, user)
+        # scrolling
+        if str(reaction.emoji) == "◀":
+            scroll = True
+            scroll_delta = -1
+        elif str(reaction.emoji) == "▶":
+            scroll = True
+            scroll_delta = 1
+        # voting
+        elif str(reaction.emoji) == "👍":
+            vote = True
+            vote_value = 1
+        elif str(reaction.emoji) == "🛑":
+            vote = True
+            vote_value = 0
+        elif str(reaction.emoji) == "👎":
+            vote = True
+            vote_value = -1
+        # invalid
         else:
-            # invalid reaction
-            return await self._remove_reaction(reaction, user)
-
-        embed = reaction.message.embeds[0]
-        if embed.footer == discord.Embed.Empty or " | " not in embed.footer.text:
             return await self._remove_reaction(reaction, user)
 
         # get reviews for given subject
-        subject = embed.title.replace(self.text.get("embed", "title"), "")
-        reviews = repo_r.get_subject_reviews(subject)
+        reviews = repo_r.get_subject_reviews(state["subject"])
+        if reviews.count() == 0:
+            return await self._remove_reaction(reaction, user)
 
         _total = 0
         for review in reviews:
@@ -245,14 +238,10 @@ class Review(rubbercog.Rubbercog):
         average = _total / reviews.count()
 
         # get page
-        footer_text = embed.footer.text
+        page = state["page"]
         if scroll:
-            pages = footer_text.split(" | ")[-1]
-            page_current = int(pages.split("/")[0]) - 1
-
-            page = (page_current + scroll_delta) % reviews.count()
-            footer_text = footer_text.replace(pages, f"{page+1}/{reviews.count()}")
-        else:
+            page = (page + scroll_delta) % reviews.count()
+        elif page >= reviews.count():
             page = 0
 
         # get new review
@@ -268,11 +257,14 @@ class Review(rubbercog.Rubbercog):
                 repo_r.add_vote(review.id, vote_value == 1, str(user.id))
 
         # update embed
+        embed = reaction.message.embeds[0]
         embed = self.fill_subject_embed(embed, review, average)
-        embed.set_footer(text=footer_text, icon_url=embed.footer.icon_url)
+        footer_text = embed.footer.text.split(" | ")[:-1] + [f"{page+1}/{reviews.count()}"]
+        embed.set_footer(text=" | ".join(footer_text), icon_url=embed.footer.icon_url)
         await reaction.message.edit(embed=embed)
 
         await self._remove_reaction(reaction, user)
+        return {"subject": state["subject"], "page": page}
 
     ##
     ## Helper functions
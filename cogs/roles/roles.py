@@ -185,7 +185,9 @@ class Roles(rubbercog.Rubbercog):
             return
 
         message_channel = self.bot.get_channel(payload.channel_id)
-        message = await message_channel.fetch_message(payload.message_id)
+        message = await self.getMessage(message_channel, payload.message_id)
+        if message is None:
+            return
 
         # make a list of current emotes
         emote_channel_list = await self._message_to_tuple_list(message)
@@ -249,8 +251,7 @@ class Roles(rubbercog.Rubbercog):
     ## Helper functions
     ##
     async def _get_subject(self, location, shortcut: str) -> discord.TextChannel:
-        db_subject = repo_s.get(shortcut)
-        if db_subject is not None:
+        if repo_s.isSubject(shortcut):
             return discord.utils.get(location.guild.text_channels, name=shortcut)
         return
 
@@ -296,16 +297,15 @@ class Roles(rubbercog.Rubbercog):
         channel = self.bot.get_channel(payload.channel_id)
         if not isinstance(channel, discord.TextChannel):
             return
-        # message
-        try:
-            message = await channel.fetch_message(payload.message_id)
-        except discord.NotFound:
-            return
-
         # halt if not react-to-role message
         if channel.id not in self.config.get("r2r_channels"):
             return
 
+        # message
+        message = await self.getMessage(channel, payload.message_id)
+        if message is None:
+            return
+
         # member
         member = message.guild.get_member(payload.user_id)
         if member.bot:
@@ -46,7 +46,7 @@ class Semester(rubbercog.Rubbercog):
         for category in ctx.guild.categories:
             category_subjects = []
             for channel in category.text_channels:
-                if repo_s.get(channel.name) is not None:
+                if repo_s.isSubject(channel.name):
                     category_subjects.append(channel)
             if len(category_subjects):
                 listing[category] = category_subjects
@@ -129,7 +129,7 @@ class Semester(rubbercog.Rubbercog):
         for channel in ctx.guild.text_channels:
             counter = 0
             # only affect subject channels
-            if repo_s.get(channel.name) is None:
+            if not repo_s.isSubject(channel.name):
                 continue
 
             for target in channel.overwrites:
@@ -1,6 +1,9 @@
 import asyncio
+import multiprocessing
 import time
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+from typing import List, Optional
 
 import discord
 from discord.ext import commands
@@ -12,12 +15,28 @@ from core import acl, rubbercog, utils
 from core.config import config
 from core.emote import emote
 from repository import image_repo, karma_repo
+from repository.image_index import ImageRecord
 
 dhash.force_pil()
-repo_i = image_repo.ImageRepository()
+repo_i = image_repo.ImageRepository(index=CogConfig("warden").get("hash index"))
 repo_k = karma_repo.KarmaRepository()
 
 
+def compute_hash(data: bytes) -> Optional[int]:
+    """Compute image dhash
+
+    This function runs in worker process, so it has to stay at module level.
+    The image is decoded in full size, so the hash matches the ones already stored.
+    Returns None if the file cannot be decoded.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        return dhash.dhash_int(image)
+    except Exception:
+        # not an image, or a broken or oversized one
+        return None
+
+
 class Warden(rubbercog.Rubbercog):
     """A cog for database lookups"""
 
@@ -33,6 +52,17 @@ class Warden(rubbercog.Rubbercog):
         self.limit_hard = 7
         self.limit_soft = 14
 
+        # forked copy of the bot would inherit locks held by its threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.config.get("hash workers"),
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        # limits attachment downloads running at once, scan batches included
+        self.downloads = asyncio.Semaphore(self.config.get("download limit"))
+
+    def cog_unload(self):
+        self.executor.shutdown(wait=False)
+
     def doCheckRepost(self, message: discord.Message):
         return (
             message.channel.id in self.config.get("deduplication channels")
@@ -66,7 +96,7 @@ class Warden(rubbercog.Rubbercog):
     @commands.Cog.listener()
     async def on_message_delete(self, message: discord.Message):
         if self.doCheckRepost(message):
-            i = repo_i.deleteByMessage(message.id)
+            i = await repo_i.run(repo_i.deleteByMessage, message.id)
             await self.console.debug(self, f"Removed {i} dhash(es) from database")
 
             # try to detect repost embed
@@ -98,10 +128,8 @@ class Warden(rubbercog.Rubbercog):
             return
 
         try:
-            embed_message = (
-                await self.getGuild()
-                .get_channel(payload.channel_id)
-                .fetch_message(payload.message_id)
+            embed_message = await self.getMessage(
+                self.getGuild().get_channel(payload.channel_id), payload.message_id
             )
         except Exception as e:
             return await self.console.debug(self, "Reaction's message not found", e)
@@ -110,8 +138,10 @@ class Warden(rubbercog.Rubbercog):
 
         try:
             repost_message = embed_message.embeds[0].footer.text.split(" | ")[1]
-            repost_message = await embed_message.channel.fetch_message(int(repost_message))
+            repost_message = await self.getMessage(embed_message.channel, int(repost_message))
         except:
+            repost_message = None
+        if repost_message is None:
             return await self.console.debug(embed_message, "Could not find repost's original.")
 
         for r in embed_message.reactions:
@@ -149,29 +179,40 @@ class Warden(rubbercog.Rubbercog):
                 except discord.NotFound:
                     pass
 
-    async def saveMessageHashes(self, message: discord.Message):
-        for f in message.attachments:
-            if f.size > self.config.get("max_size") * 1024:
-                continue
+    async def _download(self, attachment: discord.Attachment) -> Optional[bytes]:
+        try:
+            return await attachment.read()
+        except discord.HTTPException:
+            return None
 
-            fp = BytesIO()
-            await f.save(fp)
-            try:
-                i = Image.open(fp)
-            except OSError:
-                # not an image
-                continue
-            h = dhash.dhash_int(i)
-
-            # fmt: off
-            repo_i.add_image(
-                channel_id=message.channel.id,
-                message_id=message.id,
-                attachment_id=f.id,
-                dhash=str(hex(h)),
-            )
-            # fmt: on
-            yield h
+    async def getHashes(self, attachments: List[discord.Attachment]) -> List[Optional[int]]:
+        """Download attachments concurrently and hash them in worker processes
+
+        Returns list of hashes in the same order, with None for files that could not be hashed.
+        """
+        loop = asyncio.get_event_loop()
+        max_size = self.config.get("max_size") * 1024
+
+        async def process(attachment: discord.Attachment) -> Optional[int]:
+            if attachment.size > max_size:
+                return None
+            async with self.downloads:
+                data = await self._download(attachment)
+            if data is None:
+                return None
+            return await loop.run_in_executor(self.executor, compute_hash, data)
+
+        return await asyncio.gather(*[process(f) for f in attachments])
+
+    async def saveMessageHashes(self, message: discord.Message) -> List[int]:
+        records = []
+        hashes = await self.getHashes(message.attachments)
+        for f, h in zip(message.attachments, hashes):
+            if h is not None:
+                records.append(ImageRecord(f.id, message.id, message.channel.id, h))
+
+        await repo_i.run(repo_i.add_images, records)
+        return [record.dhash for record in records]
 
     @commands.group()
     @commands.check(acl.check)
@@ -188,69 +229,131 @@ class Warden(rubbercog.Rubbercog):
         """Scan current channel for images and save them as hashes
 
         limit: [all | <int>]
+
+        Unfinished scan continues where the previous one stopped, use `scan reset`
+        to start over.
         """
-        # parse parameter
+        await self._runScan(ctx, [ctx.channel], self._parseLimit(limit))
+
+    @commands.check(acl.check)
+    @commands.max_concurrency(1, per=commands.BucketType.default, wait=False)
+    @scan.command(name="all")
+    async def scan_all(self, ctx, limit):
+        """Scan all deduplication channels at once
+
+        limit: [all | <int>], applied to each channel
+        """
+        channels = [self.bot.get_channel(c) for c in self.config.get("deduplication channels")]
+        channels = [c for c in channels if c is not None]
+        await self._runScan(ctx, channels, self._parseLimit(limit))
+
+    @commands.check(acl.check)
+    @scan.command(name="reset")
+    async def scan_reset(self, ctx):
+        """Forget where the scan of current channel stopped"""
+        await repo_i.run(repo_i.deleteCheckpoint, ctx.channel.id)
+        await ctx.send("Next scan will start from the newest message.")
+
+    @commands.check(acl.check)
+    @scan.command(name="message", hidden=True)
+    async def scan_message(self, ctx, link):
+        """Scan message attachments in whole database"""
+        pass
+
+    def _parseLimit(self, limit: str) -> Optional[int]:
         if limit == "all":
-            limit = None
-        else:
-            try:
-                limit = int(limit)
-                if limit < 1:
-                    raise ValueError
-            except ValueError:
-                raise commands.BadArgument("Expected 'all' or positive integer")
+            return None
+        try:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            raise commands.BadArgument("Expected 'all' or positive integer")
+        return limit
 
-        messages = await ctx.channel.history(limit=limit).flatten()
+    async def _runScan(self, ctx, channels: List[discord.TextChannel], limit: Optional[int]):
+        """Scan channels concurrently and report the progress"""
+        stats = {channel: {"messages": 0, "hashes": 0} for channel in channels}
 
-        # fmt: off
-        title = "**INITIATING...**\n\nLoaded {} messages"
-        await asyncio.sleep(0.5)
         template = (
-            "**SCANNING IN PROGRESS**\n\n"
-            "Processed **{}** of **{}** messages ({:.1f} %)\n"
-            "Computed **{}** hashes"
+            "**{title}**\n\n"
+            "{channels}\n"
+            "Processed **{messages}** messages, computed **{hashes}** hashes "
+            "in {time:.1f} seconds."
         )
-        # fmt: on
-        msg = await ctx.send(title.format(len(messages)))
 
-        ctr_nofile = 0
-        ctr_hashes = 0
-        i = 0
+        def progress(title: str) -> str:
+            return template.format(
+                title=title,
+                channels="\n".join(
+                    f"{c.mention}: **{s['messages']}** messages, **{s['hashes']}** hashes"
+                    for c, s in stats.items()
+                ),
+                messages=sum(s["messages"] for s in stats.values()),
+                hashes=sum(s["hashes"] for s in stats.values()),
+                time=time.time() - now,
+            )
+
         now = time.time()
-        for i, message in enumerate(messages):
-            # update info on every 10th message
-            if i % 20 == 0:
-                # fmt: off
-                await msg.edit(content=template.format(
-                    i, len(messages), (i / len(messages) * 100),
-                    ctr_hashes
-                ))
-                # fmt: on
-
-            if len(message.attachments) == 0:
-                ctr_nofile += 1
-                continue
+        msg = await ctx.send(progress("INITIATING..."))
 
-            hashes = [x async for x in self.saveMessageHashes(message)]
-            ctr_hashes += len(hashes)
+        scan = asyncio.gather(*[self._scanChannel(c, limit, stats[c]) for c in channels])
+        while True:
+            done, _ = await asyncio.wait({scan}, timeout=5)
+            if done:
+                break
+            await msg.edit(content=progress("SCANNING IN PROGRESS"))
+        scan.result()
 
-        # fmt: off
-        await msg.edit(content=
-            "**SCAN COMPLETE**\n\n"
-            f"Processed **{len(messages)}** messages.\n"
-            f"Computed **{ctr_hashes}** hashes in {(time.time() - now):.1f} seconds."
-        )
-        # fmt: on
+        await msg.edit(content=progress("SCAN COMPLETE"))
 
-    @commands.check(acl.check)
-    @scan.command(name="message", hidden=True)
-    async def scan_message(self, ctx, link):
-        """Scan message attachments in whole database"""
-        pass
+    async def _scanChannel(self, channel: discord.TextChannel, limit: Optional[int], stats: dict):
+        """Stream channel history and save hashes in batches
+
+        The oldest processed message is saved after each batch, so interrupted scan can
+        be resumed. When the scan reaches the beginning of the channel, the checkpoint
+        is removed and the next scan starts from the newest message again.
+        """
+        checkpoint = await repo_i.run(repo_i.getCheckpoint, channel.id)
+        before = discord.Object(id=checkpoint) if checkpoint is not None else None
+
+        count = 0
+        batch = []
+        async for message in channel.history(limit=limit, before=before):
+            count += 1
+            stats["messages"] += 1
+            batch.append(message)
+            if len(batch) >= self.config.get("scan batch"):
+                stats["hashes"] += await self._scanBatch(channel, batch)
+                batch = []
+        if len(batch):
+            stats["hashes"] += await self._scanBatch(channel, batch)
+
+        if limit is None or count < limit:
+            # the whole channel has been processed
+            await repo_i.run(repo_i.deleteCheckpoint, channel.id)
+
+    async def _scanBatch(self, channel: discord.TextChannel, messages: List[discord.Message]):
+        """Hash attachments of messages and save them in one transaction
+
+        Returns number of saved hashes.
+        """
+        messages_files = [m for m in messages if len(m.attachments)]
+        results = await asyncio.gather(*[self.getHashes(m.attachments) for m in messages_files])
+
+        records = []
+        for message, hashes in zip(messages_files, results):
+            for f, h in zip(message.attachments, hashes):
+                if h is not None:
+                    records.append(ImageRecord(f.id, message.id, channel.id, h))
+
+        count = await repo_i.run(repo_i.add_images, records)
+        await repo_i.run(repo_i.setCheckpoint, channel.id, messages[-1].id)
+        return count
 
     async def checkDuplicate(self, message: discord.Message):
         """Check if uploaded files are known"""
-        hashes = [x async for x in self.saveMessageHashes(message)]
+        hashes = await self.saveMessageHashes(message)
 
         if len(message.attachments) > 0 and len(hashes) == 0:
             await message.add_reaction("▶")
@@ -258,57 +361,38 @@ class Warden(rubbercog.Rubbercog):
             await message.remove_reaction("▶", self.bot.user)
             return
 
-        duplicates = {}
-        posts_all = None
+        announced = set()
         for image_hash in hashes:
-            # try to look up hash directly
-            posts_full = repo_i.getHash(str(hex(image_hash)))
-
-            if len(posts_full) > 0:
-                # full match found
-                for post in posts_full:
-                    # skip current message
-                    if post.message_id == message.id:
-                        continue
-                    # add to duplicates
-                    duplicates[post] = 0
-                    await self.console.debug(message, "Full dhash match")
-                    break
-
-                # move on to the next hash
+            candidates = await repo_i.run(
+                repo_i.getNearest,
+                image_hash,
+                self.config.get("repost candidates"),
+                self.limit_soft,
+                exclude_message=message.id,
+            )
+            if not len(candidates):
+                await self.console.debug(message, f"No match within {self.limit_soft}/128 bits")
                 continue
 
-            # full match not found, iterate over whole database
-            if posts_all is None:
-                posts_all = repo_i.getAll()
-
-            hamming_min = 128
-            duplicate = None
-            for post in posts_all:
-                # skip current message
-                if post.message_id == message.id:
-                    continue
-                # do the comparison
-                post_hash = int(post.dhash, 16)
-                hamming = dhash.get_num_bits_different(image_hash, post_hash)
-                if hamming < hamming_min:
-                    duplicate = post
-                    hamming_min = hamming
-
-            duplicates[duplicate] = hamming_min
+            hamming, post = candidates[0]
+            if hamming == 0:
+                await self.console.debug(message, "Full dhash match")
+            else:
+                await self.console.debug(message, f"Closest Hamming distance: {hamming}/128 bits")
 
-            await self.console.debug(message, f"Closest Hamming distance: {hamming_min}/128 bits")
-
-        for image_hash, hamming_distance in duplicates.items():
-            if hamming_distance <= self.limit_soft:
-                await self._announceDuplicate(message, image_hash, hamming_distance)
+            # several attachments may match the same original
+            if post in announced:
+                continue
+            announced.add(post)
+            await self._announceDuplicate(message, candidates)
 
-    async def _announceDuplicate(self, message: discord.Message, original: object, hamming: int):
-        """Send message that a post is a original
+    async def _announceDuplicate(self, message: discord.Message, candidates: list):
+        """Send message that a post is a repost
 
-        original: object
-        hamming: Hamming distance between the image and closest database entry
+        candidates: (Hamming distance, ImageRecord) tuples of similar known images,
+            closest first
         """
+        hamming = candidates[0][0]
         if hamming <= self.limit_full:
             t = "**♻️ To je repost!**"
             await message.add_reaction("♻️")
@@ -320,16 +404,6 @@ class Warden(rubbercog.Rubbercog):
             await message.add_reaction("🤷🏻")
 
         prob = "{:.1f} %".format((1 - hamming / 128) * 100)
-        timestamp = utils.id_to_datetime(original.attachment_id).strftime("%Y-%m-%d %H:%M:%S")
-
-        src_chan = self.getGuild().get_channel(original.channel_id)
-        try:
-            src_post = await src_chan.fetch_message(original.message_id)
-            link = src_post.jump_url
-            author = discord.utils.escape_markdown(src_post.author.display_name)
-        except:
-            link = "404 " + emote.sad
-            author = "_??? (404)_"
 
         d = self.text.get(
             "repost description",
@@ -337,7 +411,21 @@ class Warden(rubbercog.Rubbercog):
             value=prob,
         )
         embed = discord.Embed(title=t, color=config.color, description=d, url=message.jump_url)
-        embed.add_field(name=f"**{author}**, {timestamp}", value=link, inline=False)
+        for distance, original in candidates:
+            timestamp = utils.id_to_datetime(original.attachment_id).strftime("%Y-%m-%d %H:%M:%S")
+
+            src_chan = self.getGuild().get_channel(original.channel_id)
+            try:
+                src_post = await self.getMessage(src_chan, original.message_id)
+                link = src_post.jump_url
+                author = discord.utils.escape_markdown(src_post.author.display_name)
+            except:
+                link = "404 " + emote.sad
+                author = "_??? (404)_"
+
+            if original is not candidates[0][1]:
+                link += " ({:.1f} %)".format((1 - distance / 128) * 100)
+            embed.add_field(name=f"**{author}**, {timestamp}", value=link, inline=False)
 
         embed.add_field(
             name=self.text.get("repost title"),
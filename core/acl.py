@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 from discord.ext import commands
 
 from core.config import config
@@ -5,42 +7,110 @@ from repository import acl_repo
 
 repo = acl_repo.ACLRepository()
 
+# user_id -> allow; group ID -> allow, only for groups with allow set
+Rule = namedtuple("Rule", ["default", "users", "groups"])
 
-def check(ctx: commands.Context) -> bool:
-    if ctx.author.id == config.admin_id:
-        return True
+# maximal number of remembered decisions
+DECISION_LIMIT = 10000
 
-    if ctx.guild is None:
-        # do not allow invocation in DM
-        return False
 
-    rule = repo.get_rule(ctx.guild.id, ctx.command.qualified_name)
+class Compiled:
+    """ACL tables compiled into lookup structures
 
-    # do not allow execution of unknown functions
-    if rule is None:
-        return False
+    Checks are answered without database queries. The structure has to be
+    rebuilt when the repository version changes.
+    """
 
-    # test for user override
-    for user in rule.users:
-        if ctx.author.id == user.user_id:
-            return user.allow
+    def __init__(self):
+        self.version = acl_repo.ACLRepository.version
+        groups, rules, users, rule_groups = repo.get_tables()
+
+        # (guild ID, command) -> Rule
+        self.rules = {}
+        for rule in rules:
+            self.rules[(rule.guild_id, rule.command)] = Rule(rule.default, {}, {})
+        rule_keys = {rule.id: (rule.guild_id, rule.command) for rule in rules}
+        for user in users:
+            if user.rule_id in rule_keys:
+                self.rules[rule_keys[user.rule_id]].users.setdefault(user.user_id, user.allow)
+        for rule_group in rule_groups:
+            if rule_group.rule_id in rule_keys and rule_group.allow is not None:
+                self.rules[rule_keys[rule_group.rule_id]].groups.setdefault(
+                    rule_group.group_id, rule_group.allow
+                )
+
+        # role ID -> group ID
+        self.roles = {group.role_id: group.id for group in groups if group.role_id}
+
+        # group ID -> group IDs from the group up to the root
+        names = {(group.guild_id, group.name): group for group in groups}
+        self.ancestors = {}
+        for group in groups:
+            chain = []
+            while group is not None and group.id not in chain:
+                chain.append(group.id)
+                group = names.get((group.guild_id, group.parent))
+            self.ancestors[chain[0]] = tuple(chain)
+
+        # (guild ID, command, user ID, roles hash) -> decision
+        self.decisions = {}
+
+    def decide(self, guild_id: int, command: str, user_id: int, role_ids: tuple) -> bool:
+        rule = self.rules.get((guild_id, command))
+
+        # do not allow execution of unknown functions
+        if rule is None:
+            return False
+
+        # test for user override
+        if user_id in rule.users:
+            return rule.users[user_id]
 
-    # resolve groups
-    if hasattr(ctx.author, "roles"):
         # get user's top role
-        for role in ctx.author.roles[::-1]:
-            group = repo.get_group_by_role(role.id)
-            if group is not None:
+        for role_id in role_ids[::-1]:
+            group_id = self.roles.get(role_id)
+            if group_id is not None:
                 break
         else:
-            group = None
+            group_id = None
 
         # get group hierarchy
-        while group is not None:
-            for rule_group in rule.groups:
-                if rule_group.group == group and rule_group.allow is not None:
-                    return rule_group.allow
-            group = repo.get_group(group.guild_id, group.parent)
-
-    # no settings found, return default
-    return rule.default
+        if group_id is not None:
+            for ancestor in self.ancestors[group_id]:
+                if ancestor in rule.groups:
+                    return rule.groups[ancestor]
+
+        # no settings found, return default
+        return rule.default
+
+
+compiled = None
+
+
+def get_compiled() -> Compiled:
+    """Get compiled ACL, rebuild it if the tables have changed"""
+    global compiled
+    if compiled is None or compiled.version != acl_repo.ACLRepository.version:
+        compiled = Compiled()
+    return compiled
+
+
+def check(ctx: commands.Context) -> bool:
+    if ctx.author.id == config.admin_id:
+        return True
+
+    if ctx.guild is None:
+        # do not allow invocation in DM
+        return False
+
+    acl = get_compiled()
+    role_ids = tuple(role.id for role in getattr(ctx.author, "roles", ()))
+    key = (ctx.guild.id, ctx.command.qualified_name, ctx.author.id, hash(role_ids))
+
+    decision = acl.decisions.get(key)
+    if decision is None:
+        decision = acl.decide(*key[:3], role_ids)
+        if len(acl.decisions) >= DECISION_LIMIT:
+            acl.decisions.clear()
+        acl.decisions[key] = decision
+    return decision
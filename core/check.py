@@ -79,7 +79,7 @@ async def antispam(ctx: commands.Context):
     if not isinstance(ctx.channel, discord.TextChannel):
         return
 
-    if ctx.channel.id in config.get("channels", "bot allowed"):
+    if ctx.channel.id in config.bot_allowed:
         return
 
     await ctx.send(
@@ -1,29 +1,80 @@
 import hjson
+import os
 import sys
 
 
 class Config:
-    def get(self, group: str, key: str):
-        if group in self.c and key in self.c.get(group):
-            v = self.c.get(group).get(key)
-        elif key in self.d.get(group):
-            v = self.d.get(group).get(key)
-        else:
-            v = None
+    files = ("config/config.default.hjson", "config/config.hjson")
 
+    def get(self, group: str, key: str):
+        v = self.values.get((group, key))
         if v is not None:
             return v
 
         raise AttributeError(f'Configuration file: key "{key}" in "{group}" not found')
 
+    def get_set(self, group: str, key: str) -> frozenset:
+        """Get list value as a set, for fast membership tests"""
+        result = self.sets.get((group, key))
+        if result is None:
+            result = frozenset(self.get(group, key))
+            self.sets[(group, key)] = result
+        return result
+
     def __init__(self):
         try:
-            self.d = hjson.load(open("config/config.default.hjson", "r"))
-            self.c = hjson.load(open("config/config.hjson", "r"))
+            self.load()
         except FileNotFoundError:
             print("Error loading config files.")  # noqa: T001
             sys.exit(1)
 
+    def reload(self) -> bool:
+        """Load the configuration again if the files have changed
+
+        Returns True if the configuration was reloaded.
+        """
+        try:
+            if self._mtimes() == self.mtimes:
+                return False
+            self.load()
+        except Exception as e:
+            # keep the previous configuration until the files are fixed
+            print(f"Error reloading config files: {e!r}")  # noqa: T001
+            return False
+        return True
+
+    def _mtimes(self) -> tuple:
+        return tuple(os.stat(f).st_mtime for f in self.files)
+
+    def load(self):
+        """Load the files into flat (group, key) -> value table
+
+        The new configuration is built aside and swapped in at the end, so the
+        current one is left intact if the files cannot be loaded.
+        """
+        loaded = Config.__new__(Config)
+        loaded._load()
+        self.__dict__.update(loaded.__dict__)
+
+    def _load(self):
+        mtimes = self._mtimes()
+        d = hjson.load(open(self.files[0], "r"))
+        c = hjson.load(open(self.files[1], "r"))
+
+        values = {}
+        for group in d.keys() | c.keys():
+            keys = d.get(group, {}).keys() | c.get(group, {}).keys()
+            for key in keys:
+                # custom value is used even if it is empty
+                source = c if group in c and key in c.get(group) else d
+                values[(group, key)] = source.get(group).get(key)
+
+        self.d, self.c = d, c
+        self.values = values
+        # (group, key) -> frozenset, filled on first use
+        self.sets = {}
+        self.mtimes = mtimes
+
         # fmt: off
         ##
         ## DATABASE
@@ -52,7 +103,7 @@ class Config:
         self.channel_voices   = self.get('channels', 'voice group')
         self.channel_nomic    = self.get('channels', 'voice no mic')
 
-        self.bot_allowed = self.get('channels', 'bot allowed')
+        self.bot_allowed = self.get_set('channels', 'bot allowed')
 
         ##
         ## COLOR
@@ -71,9 +122,9 @@ class Config:
         ## ROLES
         self.role_verify    = self.get('roles', 'verify_id')
         self.role_mod       = self.get('roles', 'mod_id')
-        self.roles_elevated = self.get('roles', 'elevated_ids')
-        self.roles_native   = self.get('roles', 'native')
-        self.roles_guest    = self.get('roles', 'guests')
+        self.roles_elevated = self.get_set('roles', 'elevated_ids')
+        self.roles_native   = self.get_set('roles', 'native')
+        self.roles_guest    = self.get_set('roles', 'guests')
 
         # fmt: on
 
@@ -0,0 +1,112 @@
+from collections import deque
+from typing import Hashable, Iterable, Set, Tuple
+
+
+class Trie:
+    """Prefix tree mapping strings to values
+
+    Finds all stored strings the text starts with in one pass over the text.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, Hashable]] = ()):
+        # char -> child node; values of the string ending in the node are under None
+        self.root = {}
+        for key, value in items:
+            self.add(key, value)
+
+    def add(self, key: str, value: Hashable):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, set()).add(value)
+
+    def prefixes(self, text: str) -> Set[Hashable]:
+        """Return values of all stored strings that are prefixes of the text"""
+        result = set(self.root.get(None, ()))
+        node = self.root
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                result.update(node[None])
+        return result
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton mapping strings to values
+
+    Finds all stored strings occurring anywhere in the text in one pass over
+    the text, no matter how many strings are stored. build() has to be called
+    after the strings are added.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, Hashable]] = ()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        self.ready = True
+
+        for key, value in items:
+            self.add(key, value)
+        self.build()
+
+    def __len__(self):
+        return len(self.goto)
+
+    def add(self, key: str, value: Hashable):
+        state = 0
+        for char in key:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+                self.goto[state][char] = next_state
+            state = next_state
+        self.output[state].add(value)
+        self.ready = False
+
+    def build(self):
+        """Compute failure links"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+        self.ready = True
+
+    def _states(self, text: str):
+        if not self.ready:
+            raise RuntimeError("Automaton has to be built before searching")
+
+        goto, fail = self.goto, self.fail
+        state = 0
+        yield state
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            yield state
+
+    def search(self, text: str) -> Set[Hashable]:
+        """Return values of all stored strings occurring in the text"""
+        result = set()
+        for state in self._states(text):
+            if self.output[state]:
+                result.update(self.output[state])
+        return result
+
+    def contains(self, text: str) -> bool:
+        """Return True if any stored string occurs in the text"""
+        return any(self.output[state] for state in self._states(text))
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import discord
+from discord.ext import commands
+
+from core.config import config
+from core.rubbercog import get_message
+from repository.paginator_repo import PaginatorRepository
+
+repo = PaginatorRepository()
+
+# async handler(reaction, user, state) -> new state or None to keep the old one
+Handler = Callable[[discord.Reaction, discord.User, dict], Awaitable[Optional[dict]]]
+
+
+class Registry:
+    """Paginated messages and the views that scroll them
+
+    Cogs register a handler for their view and add every paginated message
+    they send, with JSON-serializable state of the displayed page. Reactions
+    are then dispatched by message ID, so cogs do not have to recognize their
+    embeds. Raw reaction events are used, so messages missing in the bot's
+    message cache can be scrolled as well.
+
+    The state can be stored in database, so the messages can still be scrolled
+    after restart. New messages are stored right away, scrolled ones when the
+    bot shuts down.
+    """
+
+    def __init__(self):
+        self.bot = None
+        self.limit = config.get("paginator", "limit")
+        self.persist = config.get("paginator", "persist")
+        # view name -> handler
+        self.views = {}
+        # message ID -> (view name, state), least recently used first
+        self.pages = OrderedDict()
+        # IDs of messages whose state changed since it was stored
+        self.changed = set()
+
+    def listen(self, bot: commands.Bot):
+        """Dispatch reactions added to messages of the bot"""
+        self.bot = bot
+        bot.add_listener(self.dispatch, "on_raw_reaction_add")
+
+    def load(self):
+        """Load recently used messages from database"""
+        if not self.persist:
+            return
+        repo.prune(self.limit)
+        for message_id, view, state in repo.getLatest(self.limit):
+            self.pages[message_id] = (view, state)
+
+    def save(self):
+        """Store states of scrolled messages in database"""
+        if not self.persist:
+            return
+        changed = [(m, *self.pages[m]) for m in self.pages if m in self.changed]
+        repo.setAll(changed)
+        self.changed.clear()
+
+    def register(self, view: str, handler: Handler):
+        self.views[view] = handler
+
+    def unregister(self, view: str):
+        self.views.pop(view, None)
+
+    def get(self, message_id: int) -> Optional[dict]:
+        page = self.pages.get(message_id)
+        return page[1] if page is not None else None
+
+    async def add(self, message: discord.Message, view: str, state: dict):
+        """Remember the paginated message"""
+        self._set(message.id, view, state)
+        self.changed.discard(message.id)
+        if self.persist:
+            await repo.run(repo.set, message.id, view, state)
+
+    async def remove(self, message_id: int):
+        self.changed.discard(message_id)
+        if self.pages.pop(message_id, None) is not None and self.persist:
+            await repo.run(repo.delete, message_id)
+
+    async def dispatch(self, payload: discord.RawReactionActionEvent):
+        """Pass the reaction to the view owning the message"""
+        page = self.pages.get(payload.message_id)
+        if page is None or payload.user_id == self.bot.user.id:
+            return
+
+        view, state = page
+        handler = self.views.get(view)
+        if handler is None:
+            # the cog is not loaded
+            return
+
+        user = payload.member or self.bot.get_user(payload.user_id)
+        if user is None:
+            user = await self.bot.fetch_user(payload.user_id)
+        if user.bot:
+            return
+
+        channel = self.bot.get_channel(payload.channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(payload.channel_id)
+        message = await get_message(self.bot, channel, payload.message_id)
+        if message is None:
+            await self.remove(payload.message_id)
+            return
+
+        emoji = str(payload.emoji)
+        reaction = discord.utils.find(lambda r: str(r.emoji) == emoji, message.reactions)
+        if reaction is None:
+            # the fetched message may not show the reaction yet
+            reaction = discord.Reaction(message=message, data={"me": False}, emoji=payload.emoji)
+
+        new_state = await handler(reaction, user, state)
+        if new_state is not None:
+            self._set(payload.message_id, view, new_state)
+            self.changed.add(payload.message_id)
+
+    def _set(self, message_id: int, view: str, state: dict):
+        self.pages[message_id] = (view, state)
+        self.pages.move_to_end(message_id)
+        while len(self.pages) > self.limit:
+            message_id, _ = self.pages.popitem(last=False)
+            self.changed.discard(message_id)
+
+
+paginator = Registry()
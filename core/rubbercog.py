@@ -1,4 +1,8 @@
+import asyncio
 import datetime
+import time
+from collections import OrderedDict
+from typing import Optional
 
 import discord
 from discord.ext import commands
@@ -7,6 +11,110 @@ from core import output
 from core.config import config
 
 
+class MessageCache:
+    """Recently fetched messages, dropped after a while or when there are too many
+
+    The messages are snapshots, gateway events do not update them. They are
+    forgotten when the message changes, see track_messages().
+    """
+
+    def __init__(self):
+        # message ID -> (expiry, message), the oldest first
+        self.messages = OrderedDict()
+
+    def get(self, message_id: int) -> Optional[discord.Message]:
+        item = self.messages.get(message_id)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self.messages[message_id]
+            return None
+        return item[1]
+
+    def add(self, message: discord.Message):
+        expiry = time.monotonic() + config.get("bot", "fetched message ttl")
+        self.messages[message.id] = (expiry, message)
+        self.messages.move_to_end(message.id)
+        while len(self.messages) > config.get("bot", "fetched messages"):
+            self.messages.popitem(last=False)
+
+    def remove(self, message_id: int):
+        self.messages.pop(message_id, None)
+
+
+# messages fetched from the API, shared by all cogs
+_fetched_messages = MessageCache()
+# message ID -> running fetch, shared by all cogs
+_message_requests = {}
+
+
+async def get_message(
+    bot: commands.Bot, channel: discord.abc.Messageable, message_id: int
+) -> Optional[discord.Message]:
+    """Get message, calling the API only when necessary
+
+    The bot's message cache is searched first, then recently fetched messages.
+    Concurrent requests for the same message, for example from reaction listeners
+    of several cogs, share one API call. Fetched messages are kept apart from the
+    bot's message cache, so they do not push out the recent messages there.
+
+    Returns None if the message does not exist.
+    """
+    for message in reversed(bot.cached_messages):
+        if message.id == message_id:
+            return message
+
+    message = _fetched_messages.get(message_id)
+    if message is not None:
+        return message
+
+    request = _message_requests.get(message_id)
+    if request is None:
+        request = asyncio.ensure_future(_fetch_message(channel, message_id))
+        _message_requests[message_id] = request
+        request.add_done_callback(lambda _: _message_requests.pop(message_id, None))
+    return await asyncio.shield(request)
+
+
+async def _fetch_message(
+    channel: discord.abc.Messageable, message_id: int
+) -> Optional[discord.Message]:
+    try:
+        message = await channel.fetch_message(message_id)
+    except discord.NotFound:
+        return None
+
+    _fetched_messages.add(message)
+    return message
+
+
+def track_messages(bot: commands.Bot):
+    """Forget fetched messages when they change
+
+    Reaction counts, content and existence of the message are then never older
+    than the last gateway event. Has to be called before the cogs are loaded, so
+    the messages are forgotten before the cogs' listeners look them up.
+    """
+
+    async def forget(payload):
+        _fetched_messages.remove(payload.message_id)
+
+    async def forget_bulk(payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            _fetched_messages.remove(message_id)
+
+    for event in (
+        "on_raw_reaction_add",
+        "on_raw_reaction_remove",
+        "on_raw_reaction_clear",
+        "on_raw_reaction_clear_emoji",
+        "on_raw_message_edit",
+        "on_raw_message_delete",
+    ):
+        bot.add_listener(forget, event)
+    bot.add_listener(forget_bulk, "on_raw_bulk_message_delete")
+
+
 class Rubbercog(commands.Cog):
     """Main cog class"""
 
@@ -57,6 +165,12 @@ class Rubbercog(commands.Cog):
             self.roles_native = [self.getGuild().get_role(x) for x in config.roles_native]
         return self.roles_native
 
+    async def getMessage(
+        self, channel: discord.abc.Messageable, message_id: int
+    ) -> Optional[discord.Message]:
+        """Get message, calling the API only when necessary, see get_message()"""
+        return await get_message(self.bot, channel, message_id)
+
     ##
     ## DEPRECATED Utils
     ##
@@ -7,6 +7,55 @@ from core.config import config
 from core.emote import emote
 
 
+class Template:
+    """String with located placeholders
+
+    The string is converted to format string once, so it can be filled with
+    one format call. Placeholders without value are left as they are.
+    """
+
+    __slots__ = ("text", "keys", "format", "opening", "closing")
+
+    def __init__(self, text: str, opening: str = "{", closing: str = "}"):
+        self.text = text
+        self.opening = opening
+        self.closing = closing
+
+        pattern = re.escape(opening) + r"([A-Za-z_][A-Za-z0-9_]*)" + re.escape(closing)
+        keys = []
+        parts = []
+        position = 0
+        for match in re.finditer(pattern, text):
+            keys.append(match.group(1))
+            parts.append(self._escape(text[position : match.start()]))
+            parts.append("{" + match.group(1) + "}")
+            position = match.end()
+        parts.append(self._escape(text[position:]))
+
+        self.keys = frozenset(keys)
+        self.format = "".join(parts)
+
+    def render(self, values: dict) -> str:
+        if not values or not self.keys:
+            return self.text
+        return self.format.format_map(_Values(self, values))
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        return text.replace("{", "{{").replace("}", "}}")
+
+
+class _Values(dict):
+    """Template values, missing keys are rendered as placeholders"""
+
+    def __init__(self, template: Template, values: dict):
+        super().__init__((key, str(value)) for key, value in values.items())
+        self.template = template
+
+    def __missing__(self, key: str) -> str:
+        return self.template.opening + key + self.template.closing
+
+
 class Text:
     """Manage string values"""
 
@@ -17,23 +66,24 @@ class Text:
         except FileNotFoundError:
             self.custom = None
 
-    def get(self, group: str, key: str):
-        if self.custom is not None and group in self.custom and key in self.custom.get(group):
-            result = self.custom.get(group).get(key)
-        elif group in self.default and key in self.default.get(group):
-            result = self.default.get(group).get(key)
-        else:
-            return None
+        # (group, key) -> Template, list of Templates or other value
+        self.templates = {}
+        for strings in (self.default, self.custom or {}):
+            for group, values in strings.items():
+                if not isinstance(values, dict):
+                    continue
+                for key, value in values.items():
+                    self.templates[(group, key)] = self._compile(value)
 
+    def get(self, group: str, key: str):
+        result = self.templates.get((group, key))
         if isinstance(result, list):
-            return [self._replace(x) for x in result]
-        if isinstance(result, str):
-            return self._replace(result)
+            return [x.text if isinstance(x, Template) else x for x in result]
+        if isinstance(result, Template):
+            return result.text
         return result
 
     def fill(self, group: str, item: str, **kwargs):
-        result = self.get(group, item)
-
         if "nickname" in kwargs:
             kwargs["nickname"] = self._escape_user(kwargs["nickname"])
         if "user" in kwargs:
@@ -45,16 +95,26 @@ class Text:
         if "channel" in kwargs:
             kwargs["channel"] = self._mention_channel(kwargs["channel"])
 
+        template = self.templates.get((group, item))
+        if isinstance(template, Template):
+            return template.render(kwargs)
+
+        result = self.get(group, item)
         for item in kwargs:
             if "{" + item + "}" in result:
                 result = result.replace("{" + item + "}", str(kwargs[item]))
         return result
 
+    def _compile(self, value):
+        if isinstance(value, list):
+            return [self._compile(x) for x in value]
+        if isinstance(value, str):
+            return Template(self._replace(value))
+        return value
+
     def _replace(self, string: str):
         # substitute emotes
-        emotes = re.findall(r"{emote\.([a-z]+)}", string)
-        for e in emotes:
-            string = string.replace("{emote." + e + "}", emote.get(e))
+        string = re.sub(r"{emote\.([a-z]+)}", lambda m: emote.get(m.group(1)) or m.group(0), string)
 
         # substitute prefix
         string = string.replace("{prefix}", config.prefix)
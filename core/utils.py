@@ -86,7 +86,7 @@ async def room_check(ctx: commands.Context):
     if not isinstance(ctx.channel, discord.TextChannel):
         return
 
-    if ctx.channel.id not in config.get("channels", "bot allowed"):
+    if ctx.channel.id not in config.bot_allowed:
         # we do not have `bot` variable, so we have to construct the botroom mention directly
         await ctx.send(
             text.fill(
@@ -112,7 +112,7 @@ async def send(
     if not isinstance(target, discord.TextChannel) \
     or (
         isinstance(target, discord.TextChannel) and
-        target.id in config.get("channels", "bot allowed")
+        target.id in config.bot_allowed
     ):
         delete_after = None
 
@@ -6,9 +6,15 @@ from repository.database.acl import ACL_rule, ACL_group, ACL_rule_user, ACL_rule
 
 
 class ACLRepository(BaseRepository):
+    # incremented on every change, so compiled copies of the tables know they are outdated
+    version = 0
+
     def __init__(self):
         super().__init__()
 
+    def _changed(self):
+        ACLRepository.version += 1
+
     ##
     ## Groups
     ##
@@ -39,6 +45,7 @@ class ACLRepository(BaseRepository):
         group = ACL_group(guild_id=guild_id, name=name, parent=parent, role_id=role_id)
         session.add(group)
         session.commit()
+        self._changed()
 
         return group
 
@@ -66,6 +73,7 @@ class ACLRepository(BaseRepository):
             group.role_id = role_id
 
         session.commit()
+        self._changed()
         return group
 
     def delete_group(self, guild_id: int, name: str) -> dict:
@@ -76,6 +84,7 @@ class ACLRepository(BaseRepository):
         result = group.one().mirror()
         group.delete()
         session.commit()
+        self._changed()
 
         return result
 
@@ -100,6 +109,7 @@ class ACLRepository(BaseRepository):
         rule = ACL_rule(guild_id=guild_id, command=command, default=allow)
         session.add(rule)
         session.commit()
+        self._changed()
         return rule
 
     def edit_rule(self, guild_id: int, command: str, allow: bool) -> ACL_rule:
@@ -108,6 +118,7 @@ class ACLRepository(BaseRepository):
             raise NotFound(guild_id=guild_id, command=command)
         rule.default = allow
         session.commit()
+        self._changed()
         return rule
 
     def delete_rule(self, guild_id: int, command: str) -> dict:
@@ -121,10 +132,35 @@ class ACLRepository(BaseRepository):
         result = rule.one().mirror()
         rule.delete()
         session.commit()
+        self._changed()
         return result
 
     def delete_rules(self, guild_id: int) -> int:
-        return session.query(ACL_rule).filter(ACL_rule.guild_id == guild_id).delete()
+        result = session.query(ACL_rule).filter(ACL_rule.guild_id == guild_id).delete()
+        self._changed()
+        return result
+
+    def get_tables(self) -> tuple:
+        """Return all groups, rules, user constraints and group constraints"""
+        return (
+            session.query(ACL_group).all(),
+            session.query(ACL_rule).all(),
+            session.query(ACL_rule_user).order_by(ACL_rule_user.id).all(),
+            session.query(ACL_rule_group).order_by(ACL_rule_group.id).all(),
+        )
+
+    def hot_queries(self) -> dict:
+        return {
+            "get_rule": session.query(ACL_rule).filter(
+                ACL_rule.guild_id == 0, ACL_rule.command == ""
+            ),
+            "get_group": session.query(ACL_group).filter(
+                ACL_group.guild_id == 0, ACL_group.name == ""
+            ),
+            "get_group_by_role": session.query(ACL_group).filter(ACL_group.role_id == 0),
+            "rule_users": session.query(ACL_rule_user).filter(ACL_rule_user.rule_id == 0),
+            "rule_groups": session.query(ACL_rule_group).filter(ACL_rule_group.rule_id == 0),
+        }
 
     ##
     ## Constraints
@@ -141,11 +177,13 @@ class ACLRepository(BaseRepository):
 
         rule.groups.append(ACL_rule_group(group_id=group.id, allow=allow))
         session.commit()
+        self._changed()
         return rule
 
     def remove_group_constraint(self, constraint_id: int) -> bool:
         result = session.query(ACL_rule_group).filter(ACL_rule_group.id == constraint_id).delete()
         session.commit()
+        self._changed()
         return result > 0
 
     def add_user_constraint(
@@ -157,11 +195,13 @@ class ACLRepository(BaseRepository):
 
         rule.users.append(ACL_rule_user(user_id=user_id, allow=allow))
         session.commit()
+        self._changed()
         return rule
 
     def remove_user_constraint(self, constraint_id: int) -> bool:
         result = session.query(ACL_rule_user).filter(ACL_rule_user.id == constraint_id).delete()
         session.commit()
+        self._changed()
         return result > 0
 
 
@@ -4,3 +4,16 @@ from core.config import config
 class BaseRepository:
     def __init__(self):
         self.config = config
+
+    async def run(self, function, *args, **kwargs):
+        """Await blocking repository call, see repository.database.run()"""
+        from repository.database import run
+
+        return await run(function, *args, **kwargs)
+
+    def hot_queries(self) -> dict:
+        """Return queries used on hot paths, for the index audit
+
+        Keys are query names, values are queries with sample parameters.
+        """
+        return {}
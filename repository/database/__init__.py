@@ -1,15 +1,275 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
 from sqlalchemy.ext.declarative import declarative_base
 from repository.base_repository import BaseRepository
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """Connection checkout statistics"""
+
+    def __init__(self, history: int = 1000):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # wait times of recent checkouts, in seconds
+        self.waits = deque(maxlen=history)
+
+    def add(self, wait: float, timeout: bool = False):
+        with self.lock:
+            if timeout:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.waits.append(wait)
+
+    def percentile(self, percent: int) -> float:
+        """Return wait time of recent checkouts below which given percentage falls"""
+        with self.lock:
+            waits = sorted(self.waits)
+        if not len(waits):
+            return 0.0
+        return waits[min(len(waits) - 1, len(waits) * percent // 100)]
+
+
+class TimedQueuePool(QueuePool):
+    """Queue pool measuring how long the checkouts wait for connection"""
+
+    stats = PoolStats()
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        self.max_overflow = max_overflow
+
+    def capacity(self) -> int:
+        """Return number of connections the pool can open
+
+        Negative overflow means no limit, only the pool size is counted then.
+        """
+        return self.size() + max(self.max_overflow, 0)
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.add(time.monotonic() - start, timeout=True)
+            raise
+        self.stats.add(time.monotonic() - start)
+        return connection
 
 
 class Database(BaseRepository):
     def __init__(self):
         super().__init__()
         self.base = declarative_base()
-        self.db = create_engine(self.config.db_string)
+
+        options = {}
+        if self.config.db_string.startswith("postgres"):
+            options = {
+                "poolclass": TimedQueuePool,
+                "pool_size": self.config.get("database", "pool size"),
+                "max_overflow": self.config.get("database", "pool overflow"),
+                "pool_recycle": self.config.get("database", "pool recycle"),
+                "pool_pre_ping": self.config.get("database", "pool pre ping"),
+            }
+            timeout = self.config.get("database", "statement timeout")
+            if timeout > 0:
+                options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+
+        self.db = create_engine(self.config.db_string, **options)
 
 
 database = Database()
-session = sessionmaker(database.db)()
+# every thread has its own session
+session = scoped_session(sessionmaker(database.db))
+
+# sessions of worker threads, objects loaded by them stay readable after the call
+worker_session = sessionmaker(database.db, expire_on_commit=False)
+# one thread, so in-memory indexes updated by the calls do not need their own locks
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+
+
+def _call(function: Callable, *args, **kwargs):
+    session.registry.set(worker_session())
+    try:
+        return function(*args, **kwargs)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.remove()
+
+
+async def run(function: Callable, *args, **kwargs):
+    """Run blocking database function in worker thread
+
+    The function gets its own session, which is rolled back if the function
+    fails and closed when it ends. Returned objects are detached: loaded
+    attributes can be read, relationships have to be loaded inside the function.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(_call, function, *args, **kwargs))
+
+
+def bulk_increment(model, key: str, rows: List[dict]):
+    """Add values to existing rows and insert the missing ones, in one transaction
+
+    model: Database model
+    key: Name of the primary key column
+    rows: Dictionaries with primary key and column increments
+    """
+    if not len(rows):
+        return
+
+    columns = [c for c in rows[0].keys() if c != key]
+
+    try:
+        if database.db.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+
+            statement = insert(model.__table__).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[key],
+                set_={
+                    c: getattr(model.__table__.c, c) + getattr(statement.excluded, c)
+                    for c in columns
+                },
+            )
+            session.execute(statement)
+        else:
+            keys = [row[key] for row in rows]
+            known = session.query(model).filter(getattr(model, key).in_(keys))
+            known = {getattr(item, key): item for item in known}
+            for row in rows:
+                item = known.get(row[key])
+                if item is None:
+                    session.add(model(**row))
+                    continue
+                for c in columns:
+                    setattr(item, c, (getattr(item, c) or 0) + row[c])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+class Ledger:
+    """Column increments waiting to be written by bulk_increment()
+
+    Changes are collected in memory and written in one statement by flush().
+    flush() may run in database worker thread, so both are guarded by locks.
+    """
+
+    def __init__(self, model, key: str, columns: Iterable[str]):
+        """
+        model: Database model
+        key: Name of the primary key column
+        columns: Names of the incremented columns
+        """
+        self.model = model
+        self.key = key
+        self.columns = tuple(columns)
+        # key -> {column: delta}
+        self.changes: Dict[int, Dict[str, int]] = {}
+        # number of changes since last flush
+        self.events = 0
+        # reentrant, so callers can update their in-memory data under it together with add()
+        self.lock = threading.RLock()
+        # held while the changes move from the ledger to the table
+        self.flush_lock = threading.Lock()
+
+    def add(self, item_id: int, column: str, value: int):
+        """Add change to the ledger"""
+        with self.lock:
+            delta = self.changes.get(item_id)
+            if delta is None:
+                delta = dict.fromkeys(self.columns, 0)
+                self.changes[item_id] = delta
+            delta[column] += value
+            self.events += 1
+
+    def flush(self) -> int:
+        """Write pending changes to database
+
+        Returns number of updated rows.
+        """
+        with self.flush_lock:
+            with self.lock:
+                changes, events = self.changes, self.events
+                self.changes = {}
+                self.events = 0
+            if not len(changes):
+                return 0
+
+            rows = [{self.key: item_id, **delta} for item_id, delta in changes.items()]
+            try:
+                bulk_increment(self.model, self.key, rows)
+            except Exception:
+                # keep the changes for next attempt
+                with self.lock:
+                    for item_id, delta in changes.items():
+                        pending = self.changes.setdefault(item_id, dict.fromkeys(self.columns, 0))
+                        for column, value in delta.items():
+                            pending[column] += value
+                    self.events += events
+                raise
+            return len(rows)
+
+
+def create_indexes() -> List[str]:
+    """Create indexes declared by models that are missing in existing tables
+
+    Tables created by older versions are not altered by create_all().
+    Returns names of created indexes.
+    """
+    inspector = inspect(database.db)
+    tables = inspector.get_table_names()
+
+    created = []
+    for table in database.base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        known = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in known:
+                index.create(database.db)
+                created.append(index.name)
+    return created
+
+
+def explain(query) -> List[str]:
+    """Return execution plan of the query, one line per step
+
+    Sequential scans are disabled for the PostgreSQL planner, so they are only
+    planned when no index can be used, regardless of table size.
+    """
+    dialect = database.db.dialect
+    statement = query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    statement = str(statement)
+
+    with database.db.connect() as connection:
+        transaction = connection.begin()
+        try:
+            if dialect.name == "postgresql":
+                connection.execute("SET LOCAL enable_seqscan = off")
+                rows = connection.execute("EXPLAIN " + statement)
+            elif dialect.name == "sqlite":
+                rows = connection.execute("EXPLAIN QUERY PLAN " + statement)
+            else:
+                raise NotImplementedError(f"EXPLAIN is not supported for {dialect.name}")
+            return [row[-1] for row in rows]
+        finally:
+            transaction.rollback()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, BigInteger, Boolean, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, BigInteger, Boolean, String
 from sqlalchemy.orm import relationship
 
 from repository.database import database
@@ -6,6 +6,7 @@ from repository.database import database
 
 class ACL_group(database.base):
     __tablename__ = "acl_groups"
+    __table_args__ = (Index("ix_acl_groups_guild_name", "guild_id", "name"),)
 
     # fmt: off
     id       = Column(Integer, primary_key=True, autoincrement=True)
@@ -13,7 +14,7 @@ class ACL_group(database.base):
     parent   = Column(String, default=None)
 
     guild_id = Column(BigInteger)
-    role_id  = Column(BigInteger, default=0)
+    role_id  = Column(BigInteger, default=0, index=True)
 
     rules    = relationship("ACL_rule_group", back_populates="group")
     # fmt: on
@@ -46,6 +47,7 @@ class ACL_group(database.base):
 
 class ACL_rule(database.base):
     __tablename__ = "acl_rules"
+    __table_args__ = (Index("ix_acl_rules_guild_command", "guild_id", "command"),)
 
     # fmt: off
     id       = Column(Integer, primary_key=True, autoincrement=True)
@@ -86,7 +88,7 @@ class ACL_rule_user(database.base):
 
     # fmt: off
     id      = Column(Integer, primary_key=True, autoincrement=True)
-    rule_id = Column(Integer, ForeignKey('acl_rules.id', ondelete="CASCADE"))
+    rule_id = Column(Integer, ForeignKey('acl_rules.id', ondelete="CASCADE"), index=True)
     rule    = relationship("ACL_rule", back_populates="users")
     user_id = Column(BigInteger)
     allow   = Column(Boolean)
@@ -117,7 +119,7 @@ class ACL_rule_group(database.base):
 
     # fmt: off
     id       = Column(Integer, primary_key=True, autoincrement=True)
-    rule_id  = Column(Integer, ForeignKey("acl_rules.id", ondelete="CASCADE"))
+    rule_id  = Column(Integer, ForeignKey("acl_rules.id", ondelete="CASCADE"), index=True)
     rule     = relationship("ACL_rule", back_populates="groups")
     group_id = Column(Integer, ForeignKey("acl_groups.id", ondelete="CASCADE"))
     group    = relationship("ACL_group", back_populates="rules")
@@ -1,13 +1,44 @@
-from sqlalchemy import Column, String, BigInteger
+from sqlalchemy import Column, BigInteger, Index
 from repository.database import database
 
+MASK = 0xFFFFFFFFFFFFFFFF
+
 
 class Image(database.base):
     __tablename__ = "images"
+    __table_args__ = (Index("ix_images_dhash", "dhash_hi", "dhash_lo"),)
 
     # fmt: off
     attachment_id = Column(BigInteger, primary_key=True)
-    message_id    = Column(BigInteger)
+    message_id    = Column(BigInteger, index=True)
     channel_id    = Column(BigInteger)
-    dhash         = Column(String)
+    dhash_hi      = Column(BigInteger)
+    dhash_lo      = Column(BigInteger)
+    # fmt: on
+
+    @property
+    def dhash(self) -> int:
+        return Image.join(self.dhash_hi, self.dhash_lo)
+
+    @staticmethod
+    def split(dhash: int) -> tuple:
+        """Split 128-bit hash into two signed 64-bit halves"""
+
+        def signed(value: int) -> int:
+            return value - (1 << 64) if value >= (1 << 63) else value
+
+        return signed(dhash >> 64), signed(dhash & MASK)
+
+    @staticmethod
+    def join(high: int, low: int) -> int:
+        """Join two signed 64-bit halves into 128-bit hash"""
+        return ((high & MASK) << 64) | (low & MASK)
+
+
+class ImageScan(database.base):
+    __tablename__ = "image_scans"
+
+    # fmt: off
+    channel_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger)
     # fmt: on
@@ -0,0 +1,15 @@
+import datetime
+
+from sqlalchemy import Column, BigInteger, DateTime, String
+from repository.database import database
+
+
+class Paginator(database.base):
+    __tablename__ = "paginators"
+
+    # fmt: off
+    message_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    view =       Column(String)
+    state =      Column(String)
+    timestamp =  Column(DateTime, default=datetime.datetime.now, index=True)
+    # fmt: on
@@ -19,7 +19,7 @@ class Review(database.base):
     id          = Column(Integer, primary_key=True)
     discord_id  = Column(BigInteger)
     anonym      = Column(Boolean, default=True)
-    subject     = Column(String,  ForeignKey("subjects.shortcut", ondelete="CASCADE"))
+    subject     = Column(String,  ForeignKey("subjects.shortcut", ondelete="CASCADE"), index=True)
     tier        = Column(Integer, default=0)
     text_review = Column(String,  default=None)
     date        = Column(Date)
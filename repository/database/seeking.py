@@ -9,6 +9,6 @@ class Seeking(database.base):
     id =         Column(Integer, primary_key=True, autoincrement=True)
     user_id =    Column(BigInteger)
     message_id = Column(BigInteger)
-    channel_id = Column(BigInteger)
+    channel_id = Column(BigInteger, index=True)
     text =       Column(String)
     # fmt: on
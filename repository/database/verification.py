@@ -7,10 +7,10 @@ class User(database.base):
 
     # fmt: off
     discord_id = Column(BigInteger, primary_key=True)
-    login      = Column(String)
+    login      = Column(String, index=True)
     code       = Column(String)
     group      = Column(String)
-    status     = Column(String)
+    status     = Column(String, index=True)
     changed    = Column(String)
     comment    = Column(String)
     # fmt: on
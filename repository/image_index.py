@@ -0,0 +1,211 @@
+import heapq
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+ImageRecord = namedtuple("ImageRecord", ["attachment_id", "message_id", "channel_id", "dhash"])
+
+
+def hamming(a: int, b: int) -> int:
+    """Return number of different bits"""
+    return bin(a ^ b).count("1")
+
+
+class _Node:
+    __slots__ = ("dhash", "records", "children")
+
+    def __init__(self, dhash: int):
+        self.dhash = dhash
+        self.records = []
+        self.children = {}
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance of image hashes
+
+    Every node holds one hash value and all attachments sharing it. Removed
+    attachments leave their node in place, so it can still be used for routing.
+    """
+
+    def __init__(self):
+        self.root = None
+        # dhash -> node, for exact lookups and removal
+        self.nodes: Dict[int, _Node] = {}
+        # message ID -> records, for removal
+        self.messages: Dict[int, List[ImageRecord]] = {}
+
+    def __len__(self):
+        return sum(len(records) for records in self.messages.values())
+
+    def add(self, record: ImageRecord):
+        """Insert image record"""
+        self.messages.setdefault(record.message_id, []).append(record)
+
+        node = self.nodes.get(record.dhash)
+        if node is not None:
+            node.records.append(record)
+            return
+
+        new = _Node(record.dhash)
+        new.records.append(record)
+        self.nodes[record.dhash] = new
+
+        if self.root is None:
+            self.root = new
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(node.dhash, record.dhash)
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = new
+                return
+            node = child
+
+    def remove_message(self, message_id: int) -> int:
+        """Remove all records belonging to the message
+
+        Returns number of removed records.
+        """
+        records = self.messages.pop(message_id, [])
+        for record in records:
+            self.nodes[record.dhash].records.remove(record)
+        return len(records)
+
+    def nearest(
+        self, dhash: int, k: int, *, limit: int = 128, exclude_message: int = None
+    ) -> List[Tuple[int, ImageRecord]]:
+        """Find k closest records within given Hamming distance
+
+        limit: Maximal accepted distance
+        exclude_message: Ignore records belonging to this message
+
+        Returns list of (distance, record) tuples, closest first.
+        """
+        # max-heap of the best candidates, as (-distance, record)
+        best = []
+        stack = [self.root] if self.root is not None else []
+
+        while stack:
+            node = stack.pop()
+            distance = hamming(node.dhash, dhash)
+            bound = -best[0][0] if len(best) == k else limit
+
+            if distance <= bound:
+                for record in node.records:
+                    if record.message_id == exclude_message:
+                        continue
+                    heapq.heappush(best, (-distance, record))
+                    if len(best) > k:
+                        heapq.heappop(best)
+                bound = -best[0][0] if len(best) == k else limit
+
+            # triangle inequality: only visit subtrees that may contain closer hashes
+            for edge, child in node.children.items():
+                if distance - bound <= edge <= distance + bound:
+                    stack.append(child)
+
+        return sorted((-distance, record) for distance, record in best)
+
+
+class HashArray:
+    """Packed array of image hashes, scanned with vectorized XOR and popcount
+
+    Every 128-bit hash is stored as two uint64 words. A query computes
+    distances to all stored hashes in one pass.
+    """
+
+    # popcount lookup table for numpy builds without np.bitwise_count
+    _popcount = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.hashes = np.zeros((capacity, 2), dtype=np.uint64)
+        self.attachments = np.zeros(capacity, dtype=np.int64)
+        self.messages = np.zeros(capacity, dtype=np.int64)
+        self.channels = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = len(self.hashes) * 2
+        self.hashes = np.resize(self.hashes, (capacity, 2))
+        self.attachments = np.resize(self.attachments, capacity)
+        self.messages = np.resize(self.messages, capacity)
+        self.channels = np.resize(self.channels, capacity)
+
+    def _record(self, i: int) -> ImageRecord:
+        dhash = (int(self.hashes[i, 0]) << 64) | int(self.hashes[i, 1])
+        return ImageRecord(
+            int(self.attachments[i]), int(self.messages[i]), int(self.channels[i]), dhash
+        )
+
+    def add(self, record: ImageRecord):
+        """Insert image record"""
+        if self.size == len(self.hashes):
+            self._grow()
+
+        i = self.size
+        self.hashes[i] = (record.dhash >> 64, record.dhash & 0xFFFFFFFFFFFFFFFF)
+        self.attachments[i] = record.attachment_id
+        self.messages[i] = record.message_id
+        self.channels[i] = record.channel_id
+        self.size += 1
+
+    def remove_message(self, message_id: int) -> int:
+        """Remove all records belonging to the message
+
+        Returns number of removed records.
+        """
+        keep = self.messages[: self.size] != message_id
+        removed = self.size - int(np.count_nonzero(keep))
+        if removed == 0:
+            return 0
+
+        size = self.size - removed
+        self.hashes[:size] = self.hashes[: self.size][keep]
+        self.attachments[:size] = self.attachments[: self.size][keep]
+        self.messages[:size] = self.messages[: self.size][keep]
+        self.channels[:size] = self.channels[: self.size][keep]
+        self.size = size
+        return removed
+
+    def distances(self, dhash: int, *, exclude_message: int = None) -> np.ndarray:
+        """Compute Hamming distance to every stored hash
+
+        Records of excluded message get distance larger than 128.
+        """
+        query = np.array([dhash >> 64, dhash & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64)
+        xor = self.hashes[: self.size] ^ query
+
+        if hasattr(np, "bitwise_count"):
+            result = np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+        else:
+            result = self._popcount[xor.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+        if exclude_message is not None:
+            result[self.messages[: self.size] == exclude_message] = 129
+        return result
+
+    def nearest(
+        self, dhash: int, k: int, *, limit: int = 128, exclude_message: int = None
+    ) -> List[Tuple[int, ImageRecord]]:
+        """Find k closest records within given Hamming distance
+
+        limit: Maximal accepted distance
+        exclude_message: Ignore records belonging to this message
+
+        Returns list of (distance, record) tuples, closest first.
+        """
+        if self.size == 0:
+            return []
+
+        distances = self.distances(dhash, exclude_message=exclude_message)
+        k = min(k, self.size)
+        candidates = np.argpartition(distances, k - 1)[:k]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+
+        return [(int(distances[i]), self._record(i)) for i in candidates if distances[i] <= limit]
@@ -1,27 +1,87 @@
+from typing import List, Optional, Tuple, Union
+
+from sqlalchemy import bindparam, inspect
+
 from repository.base_repository import BaseRepository
-from repository.database import session
-from repository.database.image import Image
+from repository.database import database, session
+from repository.database.image import Image, ImageScan
+from repository.image_index import BKTree, HashArray, ImageRecord
 
 
 class ImageRepository(BaseRepository):
-    def add_image(self, channel_id: int, message_id: int, attachment_id: int, dhash: str):
+    # in-memory nearest neighbour index, shared by all instances
+    index = None
+    indexes = {"bktree": BKTree, "numpy": HashArray}
+
+    def __init__(self, index: str = "numpy"):
+        super().__init__()
+        if index not in self.indexes:
+            raise ValueError(f"Unknown image index: {index}")
+        self.index_class = self.indexes[index]
+
+    def add_image(self, channel_id: int, message_id: int, attachment_id: int, dhash: int):
         """Add new image hash"""
         if self.getByAttachment(attachment_id) is not None:
             # attachment already indexed
             return
 
+        dhash_hi, dhash_lo = Image.split(dhash)
         session.add(
             Image(
                 channel_id=channel_id,
                 message_id=message_id,
                 attachment_id=attachment_id,
-                dhash=dhash,
+                dhash_hi=dhash_hi,
+                dhash_lo=dhash_lo,
             )
         )
         session.commit()
 
-    def getHash(self, dhash: str):
-        return session.query(Image).filter(Image.dhash == dhash).all()
+        if ImageRepository.index is not None:
+            ImageRepository.index.add(ImageRecord(attachment_id, message_id, channel_id, dhash))
+
+    def add_images(self, records: List[ImageRecord]) -> int:
+        """Add multiple image hashes in one transaction
+
+        Attachments that are already indexed are skipped.
+        Returns number of added images.
+        """
+        if not len(records):
+            return 0
+
+        known = session.query(Image.attachment_id).filter(
+            Image.attachment_id.in_([r.attachment_id for r in records])
+        )
+        known = {attachment_id for attachment_id, in known}
+        records = [r for r in records if r.attachment_id not in known]
+
+        rows = []
+        for record in records:
+            dhash_hi, dhash_lo = Image.split(record.dhash)
+            rows.append(
+                {
+                    "attachment_id": record.attachment_id,
+                    "message_id": record.message_id,
+                    "channel_id": record.channel_id,
+                    "dhash_hi": dhash_hi,
+                    "dhash_lo": dhash_lo,
+                }
+            )
+        session.bulk_insert_mappings(Image, rows)
+        session.commit()
+
+        if ImageRepository.index is not None:
+            for record in records:
+                ImageRepository.index.add(record)
+        return len(records)
+
+    def getHash(self, dhash: int) -> List[Image]:
+        dhash_hi, dhash_lo = Image.split(dhash)
+        return (
+            session.query(Image)
+            .filter(Image.dhash_hi == dhash_hi, Image.dhash_lo == dhash_lo)
+            .all()
+        )
 
     def getByAttachment(self, attachment_id: int):
         return session.query(Image).filter(Image.attachment_id == attachment_id).one_or_none()
@@ -29,7 +89,97 @@ class ImageRepository(BaseRepository):
     def getAll(self):
         return session.query(Image)
 
+    def getAllHashes(self) -> List[ImageRecord]:
+        """Get all images as plain records, without loading ORM objects"""
+        query = session.query(
+            Image.attachment_id,
+            Image.message_id,
+            Image.channel_id,
+            Image.dhash_hi,
+            Image.dhash_lo,
+        )
+        return [
+            ImageRecord(attachment_id, message_id, channel_id, Image.join(dhash_hi, dhash_lo))
+            for attachment_id, message_id, channel_id, dhash_hi, dhash_lo in query
+        ]
+
+    def getIndex(self) -> Union[BKTree, HashArray]:
+        """Get nearest neighbour index, load it from database on first use"""
+        if not isinstance(ImageRepository.index, self.index_class):
+            index = self.index_class()
+            for record in self.getAllHashes():
+                index.add(record)
+            ImageRepository.index = index
+        return ImageRepository.index
+
+    def getNearest(
+        self, dhash: int, k: int, limit: int, *, exclude_message: int = None
+    ) -> List[Tuple[int, ImageRecord]]:
+        """Get k closest known images within given Hamming distance
+
+        Returns list of (distance, record) tuples, closest first.
+        """
+        return self.getIndex().nearest(dhash, k, limit=limit, exclude_message=exclude_message)
+
     def deleteByMessage(self, message_id: int):
         i = session.query(Image).filter(Image.message_id == message_id).delete()
         session.commit()
+
+        if ImageRepository.index is not None:
+            ImageRepository.index.remove_message(message_id)
         return i
+
+    def hot_queries(self) -> dict:
+        dhash_hi, dhash_lo = Image.split(0)
+        return {
+            "getHash": session.query(Image).filter(
+                Image.dhash_hi == dhash_hi, Image.dhash_lo == dhash_lo
+            ),
+            "getByAttachment": session.query(Image).filter(Image.attachment_id == 0),
+            "deleteByMessage": session.query(Image).filter(Image.message_id == 0),
+        }
+
+    def getCheckpoint(self, channel_id: int) -> Optional[int]:
+        """Get ID of the oldest message processed by history scan"""
+        scan = session.query(ImageScan).filter(ImageScan.channel_id == channel_id).one_or_none()
+        return scan.message_id if scan is not None else None
+
+    def setCheckpoint(self, channel_id: int, message_id: int):
+        session.merge(ImageScan(channel_id=channel_id, message_id=message_id))
+        session.commit()
+
+    def deleteCheckpoint(self, channel_id: int):
+        session.query(ImageScan).filter(ImageScan.channel_id == channel_id).delete()
+        session.commit()
+
+    def migrate(self) -> int:
+        """Convert hexadecimal string hashes from older versions to integer columns
+
+        Returns number of converted rows.
+        """
+        columns = [c["name"] for c in inspect(database.db).get_columns(Image.__tablename__)]
+        if "dhash" not in columns:
+            return 0
+
+        with database.db.begin() as connection:
+            if "dhash_hi" not in columns:
+                connection.execute("ALTER TABLE images ADD COLUMN dhash_hi BIGINT")
+            if "dhash_lo" not in columns:
+                connection.execute("ALTER TABLE images ADD COLUMN dhash_lo BIGINT")
+
+            rows = connection.execute("SELECT attachment_id, dhash FROM images").fetchall()
+            parameters = []
+            for attachment_id, dhash in rows:
+                dhash_hi, dhash_lo = Image.split(int(dhash, 16))
+                parameters.append({"b_id": attachment_id, "b_hi": dhash_hi, "b_lo": dhash_lo})
+            if len(parameters):
+                connection.execute(
+                    Image.__table__.update()
+                    .where(Image.attachment_id == bindparam("b_id"))
+                    .values(dhash_hi=bindparam("b_hi"), dhash_lo=bindparam("b_lo")),
+                    parameters,
+                )
+
+            connection.execute("ALTER TABLE images DROP COLUMN dhash")
+
+        return len(rows)
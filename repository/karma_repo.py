@@ -1,9 +1,10 @@
-from sqlalchemy import func
+from typing import Dict, List, Optional, Tuple
 
 from core import utils
 from repository.base_repository import BaseRepository
-from repository.database import session
+from repository.database import Ledger, session
 from repository.database.karma import Karma, Karma_emoji
+from repository.ranking import Ranking
 
 
 class Karma_row_data:
@@ -20,41 +21,115 @@ class Karma_data:
 
 
 class KarmaRepository(BaseRepository):
+    # karma changes waiting to be written, shared by all instances
+    ledger = Ledger(Karma, "discord_id", ("karma", "positive", "negative"))
+    # column -> Ranking, loaded on first use
+    rankings = None
+    # emoji ID -> value, loaded on first use
+    emojis = None
+
     def __init__(self):
         super().__init__()
 
-    def getMember(self, member_id: int):
-        """Return user with given ID"""
-        return session.query(Karma).filter(Karma.discord_id == member_id).one_or_none()
+    def getMember(self, member_id: int) -> Optional[Karma]:
+        """Return user with given ID, as detached object"""
+        rankings = self.getRankings()
+        if member_id not in rankings["karma"]:
+            return None
+        return self._toKarma([(member_id, None)], rankings)[0]
 
     def getMemberCount(self):
-        return session.query(Karma).count()
+        return len(self.getRankings()["karma"])
 
     def updateMemberKarma(self, member_id: int, value: int):
         """Add karma to user"""
-        # TODO This is duplicate for `update_karma_get`
-        user = self.getMember(member_id)
-        if user is None:
-            session.add(Karma(discord_id=member_id, karma=value))
-        else:
-            user.karma += value
-        session.commit()
+        self._record(member_id, "karma", value)
+
+    def pending(self) -> int:
+        """Return number of karma changes waiting for flush"""
+        return KarmaRepository.ledger.events
+
+    def flush(self) -> int:
+        """Write pending karma changes to database
+
+        Returns number of updated users.
+        """
+        return KarmaRepository.ledger.flush()
+
+    def getRankings(self) -> Dict[str, Ranking]:
+        """Get in-memory rankings of all karma columns, load them on first use
+
+        The rankings include changes still waiting in the ledger, so they can be
+        read without flushing it.
+        """
+        rankings = KarmaRepository.rankings
+        if rankings is not None:
+            return rankings
+
+        ledger = KarmaRepository.ledger
+        # the flush cannot move changes from the ledger to the table meanwhile
+        with ledger.flush_lock:
+            rankings = KarmaRepository.rankings
+            if rankings is None:
+                rows = session.query(
+                    Karma.discord_id, Karma.karma, Karma.positive, Karma.negative
+                ).all()
+                rankings = {
+                    "karma": Ranking((row[0], row[1]) for row in rows),
+                    "positive": Ranking((row[0], row[2]) for row in rows),
+                    "negative": Ranking((row[0], row[3]) for row in rows),
+                }
+                with ledger.lock:
+                    for discord_id, delta in ledger.changes.items():
+                        self._rank(rankings, discord_id, delta)
+                    KarmaRepository.rankings = rankings
+        return rankings
+
+    def _rank(self, rankings: Dict[str, Ranking], discord_id: int, delta: Dict[str, int]):
+        """Apply karma change to the rankings
+
+        Every column gets the member, the row is created with all of them.
+        """
+        for column, value in delta.items():
+            rankings[column].add(discord_id, value)
+
+    def _record(self, member_id: int, column: str, value: int):
+        """Add karma change to the ledger and to loaded rankings"""
+        ledger = KarmaRepository.ledger
+        with ledger.lock:
+            ledger.add(member_id, column, value)
+            if KarmaRepository.rankings is not None:
+                delta = dict.fromkeys(ledger.columns, 0)
+                delta[column] = value
+                self._rank(KarmaRepository.rankings, member_id, delta)
+
+    def getEmojiValues(self) -> Dict[str, int]:
+        """Get values of all voted emojis, load them on first use
+
+        The table is small and rarely written, so it is kept in memory and
+        updated by set_emoji_value() and remove_emoji().
+        """
+        if KarmaRepository.emojis is None:
+            KarmaRepository.emojis = {
+                emoji_id: value
+                for emoji_id, value in session.query(Karma_emoji.emoji_ID, Karma_emoji.value)
+            }
+        return KarmaRepository.emojis
 
     def getEmotesByValue(self, value):
-        emotes = session.query(Karma_emoji).filter(Karma_emoji.value == value)
-        return [emote.emoji_ID for emote in emotes]
+        value = int(value)
+        return [e for e, v in self.getEmojiValues().items() if v == value]
 
     # FUNCTIONS BELOW PROBABLY NEED REWRITE
     # TREAT WITH CARE!
 
     def get_ids_of_emojis_valued(self, val):
         """Returns a list of ids of emojis with specified value"""
-        emojis = session.query(Karma_emoji).filter(Karma_emoji.value == val)
-        return [emoji.emoji_ID for emoji in emojis]
+        return self.getEmotesByValue(val)
 
     def get_all_emojis(self):
-        """Returns a list of Karma_emoji objects."""
-        return session.query(Karma_emoji)
+        """Returns a list of detached Karma_emoji objects."""
+        return [Karma_emoji(emoji_ID=e, value=v) for e, v in self.getEmojiValues().items()]
 
     def emoji_value(self, emoji_id: str):
         """Returns the value of an emoji.
@@ -65,37 +140,27 @@ class KarmaRepository(BaseRepository):
     def emoji_value_raw(self, emoji_id: str):
         """Returns the value of an emoji.
         If the emoji has not been voted for, returns None."""
-        emoji = (
-            session.query(Karma_emoji)
-            .filter(Karma_emoji.emoji_ID == utils.str_emoji_id(emoji_id))
-            .one_or_none()
-        )
-        return emoji.value if emoji else None
+        return self.getEmojiValues().get(utils.str_emoji_id(emoji_id))
 
     def set_emoji_value(self, emoji_id: str, value: int):
         emoji = Karma_emoji(emoji_ID=utils.str_emoji_id(emoji_id), value=str(value))
         # Merge == 'insert on duplicate key update'
         session.merge(emoji)
         session.commit()
+        self.getEmojiValues()[emoji.emoji_ID] = int(value)
 
     def remove_emoji(self, emoji_id):
-        session.query(Karma_emoji).filter(
-            Karma_emoji.emoji_ID == utils.str_emoji_id(emoji_id)
-        ).delete()
+        emoji_id = utils.str_emoji_id(emoji_id)
+        session.query(Karma_emoji).filter(Karma_emoji.emoji_ID == emoji_id).delete()
         session.commit()
+        self.getEmojiValues().pop(emoji_id, None)
 
     def update_karma(self, member, giver, emoji_value, remove=False):
         self.update_karma_get(member, emoji_value)
         self.update_karma_give(giver, emoji_value, remove)
 
-        session.commit()
-
     def update_karma_get(self, member, emoji_value):
-        members_karma = self.get_karma_object(member.id)
-        if members_karma is not None:
-            members_karma.karma += emoji_value
-        else:
-            session.add(Karma(discord_id=member.id, karma=emoji_value))
+        self._record(member.id, "karma", emoji_value)
 
     def update_karma_give(self, giver, emoji_value, remove):
         if emoji_value > 0:
@@ -112,13 +177,7 @@ class KarmaRepository(BaseRepository):
         if column == "negative":
             emoji_value *= -1
 
-        givers_karma = self.get_karma_object(giver.id)
-        if givers_karma is not None:
-            setattr(givers_karma, column, getattr(givers_karma, column) + emoji_value)
-        else:
-            new_giver = Karma(discord_id=giver.id)
-            setattr(new_giver, column, emoji_value)
-            session.add(new_giver)
+        self._record(giver.id, column, emoji_value)
 
     def karma_emoji(self, member_id, giver, emoji_id):
         emoji_value = int(self.emoji_value(str(emoji_id)))
@@ -131,30 +190,56 @@ class KarmaRepository(BaseRepository):
             self.update_karma(member_id, giver, emoji_value * (-1), True)
 
     def get_karma_object(self, member_id=None):
-        return session.query(Karma).filter(Karma.discord_id == str(member_id)).one_or_none()
+        return self.getMember(int(member_id))
 
     def get_karma_position(self, column, karma):
-        value = (
-            session.query(func.count(Karma.discord_id)).filter(getattr(Karma, column) > karma).one()
-        )
-        return value[0] + 1
+        return self.getRankings()[column].position(karma)
 
     def get_karma(self, member_id):
-        karma_object = self.get_karma_object(member_id)
-
-        if karma_object is None:
-            karma_object = Karma(karma=0, positive=0, negative=0)
-
-        order = self.get_karma_position("karma", karma_object.karma)
-        pos_order = self.get_karma_position("positive", karma_object.positive)
-        neg_order = self.get_karma_position("negative", karma_object.negative)
-
-        karma = Karma_row_data(karma_object.karma, order)
-        positive = Karma_row_data(karma_object.positive, pos_order)
-        negative = Karma_row_data(karma_object.negative, neg_order)
-
-        result = Karma_data(karma, positive, negative)
-        return result
-
-    def getLeaderboard(self, order: str, offset: int = 0, limit: int = 10):
-        return session.query(Karma).order_by(order).offset(offset).limit(limit)
+        rankings = self.getRankings()
+
+        result = []
+        for column in ("karma", "positive", "negative"):
+            value = rankings[column].get(member_id)
+            result.append(Karma_row_data(value, rankings[column].position(value)))
+
+        return Karma_data(*result)
+
+    def getLeaderboard(
+        self, column: str, offset: int = 0, limit: int = 10, *, descending: bool = True
+    ) -> List[Karma]:
+        """Get leaderboard page from in-memory ranking of given column
+
+        Returns detached Karma objects.
+        """
+        rankings = self.getRankings()
+        page = rankings[column].page(offset, limit, descending=descending)
+        return self._toKarma(page, rankings)
+
+    def seekLeaderboard(
+        self,
+        column: str,
+        cursor: Optional[Tuple[int, int]],
+        limit: int = 10,
+        *,
+        descending: bool = True,
+        forward: bool = True,
+    ) -> Tuple[int, List[Karma]]:
+        """Get leaderboard page next to the cursor, see Ranking.seek()
+
+        Returns offset of the page and detached Karma objects.
+        """
+        rankings = self.getRankings()
+        offset, page = rankings[column].seek(cursor, limit, descending=descending, forward=forward)
+        return offset, self._toKarma(page, rankings)
+
+    def _toKarma(self, page: List[Tuple[int, int]], rankings: Dict[str, Ranking]) -> List[Karma]:
+        return [
+            Karma(
+                discord_id=discord_id,
+                karma=rankings["karma"].get(discord_id),
+                positive=rankings["positive"].get(discord_id),
+                negative=rankings["negative"].get(discord_id),
+            )
+            for discord_id, _ in page
+        ]
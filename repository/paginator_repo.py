@@ -0,0 +1,64 @@
+import datetime
+import json
+from typing import List, Tuple
+
+from repository.base_repository import BaseRepository
+from repository.database import session
+from repository.database.paginator import Paginator
+
+
+class PaginatorRepository(BaseRepository):
+    def set(self, message_id: int, view: str, state: dict):
+        """Add or update state of paginated message"""
+        session.merge(
+            Paginator(
+                message_id=message_id,
+                view=view,
+                state=json.dumps(state),
+                timestamp=datetime.datetime.now(),
+            )
+        )
+        session.commit()
+
+    def setAll(self, pages: List[Tuple[int, str, dict]]):
+        """Add or update states of paginated messages, the oldest first"""
+        for message_id, view, state in pages:
+            session.merge(
+                Paginator(
+                    message_id=message_id,
+                    view=view,
+                    state=json.dumps(state),
+                    timestamp=datetime.datetime.now(),
+                )
+            )
+        session.commit()
+
+    def getLatest(self, limit: int) -> List[Tuple[int, str, dict]]:
+        """Get (message ID, view, state) of recently used messages, the oldest first"""
+        query = (
+            session.query(Paginator.message_id, Paginator.view, Paginator.state)
+            .order_by(Paginator.timestamp.desc())
+            .limit(limit)
+        )
+        return [(message_id, view, json.loads(state)) for message_id, view, state in query][::-1]
+
+    def prune(self, limit: int) -> int:
+        """Delete all but the most recently used messages
+
+        Returns number of deleted rows.
+        """
+        newest = session.query(Paginator.timestamp).order_by(Paginator.timestamp.desc())
+        cutoff = newest.offset(limit - 1).limit(1).scalar() if limit > 0 else None
+        query = session.query(Paginator)
+        if cutoff is not None:
+            query = query.filter(Paginator.timestamp < cutoff)
+        elif limit > 0:
+            return 0
+        num = query.delete(synchronize_session=False)
+        session.commit()
+        return num
+
+    def delete(self, message_id: int) -> int:
+        num = session.query(Paginator).filter(Paginator.message_id == message_id).delete()
+        session.commit()
+        return num
@@ -1,36 +1,85 @@
-from sqlalchemy import func
+from typing import List, Optional, Tuple
 
 from repository.base_repository import BaseRepository
-from repository.database import session
+from repository.database import Ledger, session
 from repository.database.points import Points
+from repository.ranking import Ranking
 
 
 class PointsRepository(BaseRepository):
+    # point increments waiting to be written, shared by all instances
+    ledger = Ledger(Points, "user_id", ("points",))
+    # points of all users, loaded on first use
+    ranking = None
+
     def increment(self, user_id: int, points: int):
         """Add points to user"""
-        user = session.query(Points).filter(Points.user_id == user_id).one_or_none()
-        if user is None:
-            session.add(Points(user_id=user_id, points=points))
-        else:
-            user.points += points
-        session.commit()
+        ledger = PointsRepository.ledger
+        with ledger.lock:
+            ledger.add(user_id, "points", points)
+            if PointsRepository.ranking is not None:
+                PointsRepository.ranking.add(user_id, points)
+
+    def pending(self) -> int:
+        """Return number of increments waiting for flush"""
+        return PointsRepository.ledger.events
+
+    def flush(self) -> int:
+        """Write pending increments to database
+
+        Returns number of updated users.
+        """
+        return PointsRepository.ledger.flush()
+
+    def getRanking(self) -> Ranking:
+        """Get in-memory ranking of all users, load it on first use
+
+        The ranking includes increments still waiting in the ledger, so it can
+        be read without flushing it.
+        """
+        ranking = PointsRepository.ranking
+        if ranking is not None:
+            return ranking
+
+        ledger = PointsRepository.ledger
+        # the flush cannot move increments from the ledger to the table meanwhile
+        with ledger.flush_lock:
+            ranking = PointsRepository.ranking
+            if ranking is None:
+                ranking = Ranking(session.query(Points.user_id, Points.points).all())
+                with ledger.lock:
+                    for user_id, delta in ledger.changes.items():
+                        ranking.add(user_id, delta["points"])
+                    PointsRepository.ranking = ranking
+        return ranking
 
-    def get(self, user_id: int):
-        return session.query(Points).filter(Points.user_id == user_id).one_or_none()
+    def get(self, user_id: int) -> Optional[Points]:
+        """Get user points, as detached object"""
+        ranking = self.getRanking()
+        if user_id not in ranking:
+            return None
+        return Points(user_id=user_id, points=ranking.get(user_id))
 
     def getPosition(self, points):
-        result = (
-            session.query(func.count(Points.user_id))
-            .filter(getattr(Points, "points") > points)
-            .one_or_none()
-        )
-        return result[0] + 1 if result else None
-
-    def getUsers(self, order: str, limit: int = 10, offset: int = 0):
-        if order == "desc":
-            order = Points.points.desc()
-        elif order == "asc":
-            order = Points.points.asc()
-        else:
+        return self.getRanking().position(points)
+
+    def getUsers(self, order: str, limit: int = 10, offset: int = 0) -> List[Points]:
+        """Get leaderboard page, as detached objects"""
+        if order not in ("desc", "asc"):
+            raise Exception("Invalid order: " + order)
+        page = self.getRanking().page(offset, limit, descending=order == "desc")
+        return [Points(user_id=user_id, points=points) for user_id, points in page]
+
+    def seekUsers(
+        self, order: str, cursor: Optional[Tuple[int, int]], limit: int = 10, *, forward=True
+    ) -> Tuple[int, List[Points]]:
+        """Get leaderboard page next to the cursor, see Ranking.seek()
+
+        Returns offset of the page and detached objects.
+        """
+        if order not in ("desc", "asc"):
             raise Exception("Invalid order: " + order)
-        return session.query(Points).order_by(order).offset(offset).limit(limit)
+        offset, page = self.getRanking().seek(
+            cursor, limit, descending=order == "desc", forward=forward
+        )
+        return offset, [Points(user_id=user_id, points=points) for user_id, points in page]
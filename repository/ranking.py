@@ -0,0 +1,100 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Ranking:
+    """Values of one column for all users, kept in sorted order
+
+    Sorted (value, ID) pairs allow position lookups by binary search and
+    leaderboard pages by slicing, without querying database.
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, int]] = ()):
+        # updates may come from database worker thread
+        self.lock = threading.Lock()
+        # ID -> value
+        self.values: Dict[int, int] = {}
+        # (value, ID) pairs, ascending
+        self.order: List[Tuple[int, int]] = []
+
+        for item_id, value in items:
+            self.values[item_id] = value or 0
+        self.order = sorted((value, item_id) for item_id, value in self.values.items())
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, item_id: int):
+        return item_id in self.values
+
+    def get(self, item_id: int, default: int = 0) -> int:
+        return self.values.get(item_id, default)
+
+    def set(self, item_id: int, value: int):
+        """Set new value of the item"""
+        value = value or 0
+        with self.lock:
+            old = self.values.get(item_id)
+            if old is not None:
+                if old == value:
+                    return
+                del self.order[bisect_right(self.order, (old, item_id)) - 1]
+            self.values[item_id] = value
+            insort(self.order, (value, item_id))
+
+    def add(self, item_id: int, delta: int):
+        """Add delta to the value of the item"""
+        self.set(item_id, self.get(item_id) + delta)
+
+    def position(self, value: int) -> int:
+        """Return position of given value, counted from the highest
+
+        Equal values share the same position.
+        """
+        with self.lock:
+            return len(self.order) - bisect_right(self.order, (value, float("inf"))) + 1
+
+    def page(self, offset: int, limit: int, *, descending: bool = True) -> List[Tuple[int, int]]:
+        """Return (ID, value) pairs of one leaderboard page"""
+        with self.lock:
+            if descending:
+                end = max(len(self.order) - offset, 0)
+                items = self.order[max(end - limit, 0) : end][::-1]
+            else:
+                items = self.order[offset : offset + limit]
+        return [(item_id, value) for value, item_id in items]
+
+    def seek(
+        self,
+        cursor: Optional[Tuple[int, int]],
+        limit: int,
+        *,
+        descending: bool = True,
+        forward: bool = True,
+    ) -> Tuple[int, List[Tuple[int, int]]]:
+        """Return leaderboard page next to the cursor
+
+        cursor: (value, ID) of the last item of current page when going forward,
+            of the first item when going backward; None for the first page
+        The page does not shift when values of other items change between calls.
+
+        Returns offset of the page and its (ID, value) pairs.
+        """
+        with self.lock:
+            size = len(self.order)
+            if cursor is None:
+                start, end = (max(size - limit, 0), size) if descending else (0, min(limit, size))
+            elif descending == forward:
+                # towards lower values
+                end = bisect_left(self.order, tuple(cursor))
+                start = max(end - limit, 0)
+            else:
+                # towards higher values
+                start = bisect_right(self.order, tuple(cursor))
+                end = min(start + limit, size)
+            items = self.order[start:end]
+
+        if descending:
+            return size - end, [(item_id, value) for value, item_id in reversed(items)]
+        return start, [(item_id, value) for value, item_id in items]
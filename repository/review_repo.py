@@ -4,6 +4,7 @@ from sqlalchemy import func, desc
 from repository.base_repository import BaseRepository
 from repository.database import session
 from repository.database.review import Review, ReviewRelevance, Subject
+from repository.subject_repo import SubjectRepository
 
 
 class ReviewRepository(BaseRepository):
@@ -86,12 +87,22 @@ class ReviewRepository(BaseRepository):
             ReviewRelevance.review == review_id, ReviewRelevance.discord_id == author
         ).delete()
 
+    def hot_queries(self) -> dict:
+        return {
+            "get_review_by_author_subject": session.query(Review).filter(
+                Review.subject == "", Review.discord_id == 0
+            ),
+            "get_votes_count": session.query(ReviewRelevance).filter(
+                ReviewRelevance.review == 0, ReviewRelevance.vote.is_(True)
+            ),
+        }
+
     def get_subject(self, shortcut):
         # FIXME Outdated, moved to subject_repo.py
         return session.query(Subject).filter(Subject.shortcut == shortcut)
 
     def add_subject(self, shortcut):
         # FIXME Outdated, moved to subject_repo.py
-        subject = Subject(shortcut=shortcut)
-        session.merge(subject)
+        subject = session.merge(Subject(shortcut=shortcut))
         session.commit()
+        SubjectRepository().cache(shortcut, subject.name, subject.category)
@@ -27,3 +27,8 @@ class SeekingRepository(BaseRepository):
         num = session.query(Seeking).filter(Seeking.id == item_id).delete()
         session.commit()
         return num
+
+    def hot_queries(self) -> dict:
+        return {
+            "getAll": session.query(Seeking).filter(Seeking.channel_id == 0),
+        }
@@ -1,22 +1,55 @@
+from typing import Dict, List, Optional, Set
+
 from repository.base_repository import BaseRepository
 from repository.database import session
 from repository.database.review import Subject
 
 
 class SubjectRepository(BaseRepository):
+    """Subjects are read from memory
+
+    All subjects are loaded once and shared by all instances. The cache is
+    updated by every change made through the repositories.
+    """
+
+    # shortcut -> detached Subject
+    subjects: Optional[Dict[str, Subject]] = None
+    # category -> shortcuts
+    categories: Dict[str, Set[str]] = {}
+
     def __init__(self):
         super().__init__()
 
-    def get(self, shortcut: str):
-        return session.query(Subject).filter(Subject.shortcut == shortcut).one_or_none()
+    def load(self):
+        """Load all subjects from database"""
+        subjects = {}
+        categories = {}
+        query = session.query(Subject.shortcut, Subject.name, Subject.category)
+        for shortcut, name, category in query:
+            subjects[shortcut] = Subject(shortcut=shortcut, name=name, category=category)
+            categories.setdefault(category, set()).add(shortcut)
+        SubjectRepository.subjects = subjects
+        SubjectRepository.categories = categories
+
+    def get(self, shortcut: str) -> Optional[Subject]:
+        return self._getSubjects().get(shortcut)
+
+    def getAll(self) -> List[Subject]:
+        return list(self._getSubjects().values())
 
-    def getAll(self):
-        return session.query(Subject).all()
+    def getByCategory(self, category: str) -> List[Subject]:
+        subjects = self._getSubjects()
+        return [subjects[s] for s in sorted(SubjectRepository.categories.get(category, ()))]
+
+    def isSubject(self, shortcut: str) -> bool:
+        """Check if the subject exists, without querying database"""
+        return shortcut in self._getSubjects()
 
     def add(self, shortcut: str, name: str, category: str) -> Subject:
         subject = Subject(shortcut=shortcut, name=name, category=category)
         session.merge(subject)
         session.commit()
+        self.cache(shortcut, name, category)
         return subject
 
     def update(self, shortcut: str, *, name: str = None, category: str = None) -> Subject:
@@ -24,7 +57,35 @@ class SubjectRepository(BaseRepository):
         subject.name = name or subject.name
         subject.category = category or subject.category
         session.commit()
+        self.cache(shortcut, subject.name, subject.category)
         return subject
 
     def remove(self, shortcut: str):
         session.query(Subject).filter(Subject.shortcut == shortcut).delete()
+        session.commit()
+        self._uncache(shortcut)
+
+    def cache(self, shortcut: str, name: str = None, category: str = None):
+        """Add or update subject in memory, if the subjects are loaded
+
+        Used when the subject is written to database outside of this repository.
+        """
+        if SubjectRepository.subjects is None:
+            return
+        self._uncache(shortcut)
+        SubjectRepository.subjects[shortcut] = Subject(
+            shortcut=shortcut, name=name, category=category
+        )
+        SubjectRepository.categories.setdefault(category, set()).add(shortcut)
+
+    def _getSubjects(self) -> Dict[str, Subject]:
+        if SubjectRepository.subjects is None:
+            self.load()
+        return SubjectRepository.subjects
+
+    def _uncache(self, shortcut: str):
+        if SubjectRepository.subjects is None:
+            return
+        subject = SubjectRepository.subjects.pop(shortcut, None)
+        if subject is not None:
+            SubjectRepository.categories.get(subject.category, set()).discard(shortcut)
@@ -97,6 +97,12 @@ class UserRepository(BaseRepository):
     def filterGroup(self, group: str):
         return session.query(User).filter(User.group == group).all()
 
+    def hot_queries(self) -> dict:
+        return {
+            "getByLogin": session.query(User).filter(User.login == ""),
+            "filterStatus": session.query(User).filter(User.status == "pending"),
+        }
+
     def countStatus(self, status: str):
         return session.query(User).filter(User.status == status).count()
 
@@ -2,11 +2,13 @@ import traceback
 from datetime import datetime
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
+from cogs.resource import CogConfig
 from core import acl, help, rubbercog, output, utils
 from core.config import config
-from repository.database import database
+from core.paginator import paginator
+from repository.database import create_indexes, database
 from repository.database import session
 from repository.database.karma import Karma, Karma_emoji
 from repository.database.seeking import Seeking
@@ -15,7 +17,10 @@ from repository.database.verification import User
 from repository.database.image import Image
 from repository.database.points import Points
 from repository.database.acl import ACL_group, ACL_rule, ACL_rule_user, ACL_rule_group
+from repository.database.paginator import Paginator
+from repository.image_repo import ImageRepository
 from repository.review_repo import ReviewRepository
+from repository.subject_repo import SubjectRepository
 
 bot = commands.Bot(
     command_prefix=config.prefix,
@@ -24,6 +29,13 @@ bot = commands.Bot(
 )
 
 event = output.Event(bot)
+console = output.Console(bot)
+
+# forget fetched messages when they change
+rubbercog.track_messages(bot)
+
+# scrolling of all paginated embeds
+paginator.listen(bot)
 
 # fill DB with subjects shortcut, needed for reviews
 def load_subjects():
@@ -51,6 +63,10 @@ async def on_ready():
         )
         started = True
 
+        if config.get("bot", "config reload"):
+            watch_config.change_interval(seconds=config.get("bot", "config reload"))
+            watch_config.start()
+
     print(message)
     channel = bot.get_channel(config.get("channels", "stdout"))
     await channel.send(f"```{message}```")
@@ -68,6 +84,19 @@ async def on_error(event, *args, **kwargs):
             await channel.send("```\n{}```".format(message))
 
 
+@tasks.loop(seconds=10.0)
+async def watch_config():
+    """Load changed configuration files"""
+    if config.reload():
+        print("Reloaded: config")
+    reloaded, failed = CogConfig.reload_all()
+    for cog in reloaded:
+        print(f"Reloaded: {cog.upper()} config")
+        bot.dispatch("config_reload", cog)
+    for cog, error in failed.items():
+        await console.error("config", f"Could not reload {cog.upper()} config.", error)
+
+
 @bot.command()
 @commands.check(acl.check)
 async def load(ctx, extension):
@@ -97,18 +126,30 @@ async def reload(ctx, extension):
         await ctx.send("Jsem ale zavřená v Dockeru, víš o tom?")
 
 
-# database.base.metadata.drop_all(database.db)
-database.base.metadata.create_all(database.db)
-session.commit()  # Making sure
+# worker processes (Warden's hashing) import this file, but must not start the bot
+if __name__ == "__main__":
+    # database.base.metadata.drop_all(database.db)
+    database.base.metadata.create_all(database.db)
+    session.commit()  # Making sure
 
-load_subjects()
+    # convert data stored by older versions
+    ImageRepository().migrate()
+    for index in create_indexes():
+        print(f"Created index: {index}")
 
-bot.load_extension("cogs.errors")
-print("Loaded: ERRORS (implicit)")
-bot.load_extension("cogs.acl")
-print("Loaded: ACL (implicit)")
-for extension in config.extensions:
-    bot.load_extension(f"cogs.{extension}")
-    print(f"Loaded: {extension.upper()}")
+    load_subjects()
+    SubjectRepository().load()
+    paginator.load()
+
+    bot.load_extension("cogs.errors")
+    print("Loaded: ERRORS (implicit)")
+    bot.load_extension("cogs.acl")
+    print("Loaded: ACL (implicit)")
+    for extension in config.extensions:
+        bot.load_extension(f"cogs.{extension}")
+        print(f"Loaded: {extension.upper()}")
+
+    bot.run(config.key)
 
-bot.run(config.key)
+    # scrolled messages, so they can be scrolled after restart
+    paginator.save()